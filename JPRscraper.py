@@ -10,11 +10,19 @@
 #Import the required packages
 import requests, datetime, json, csv, re, os, pytz, pandas as pd
 
+import http_cache, normalize, oregon_index, profiling, results_bundle, results_dataset, results_db, retention
+
+#Run with --profile to save a profile of this run to profiles/. See profiling.py
+profiling.start_if_requested()
+
+#When working on the charts cell by cell, set NOTEBOOK_CACHE=300 (or run http_cache.interactive(300) in a cell) so that
+#re-running a cell reuses what it fetched in the last 5 minutes instead of asking the SOS again. See http_cache.py
+
 # Import Propositions from California Secretary of State
 
 #Set the URL for the California ballot measure API
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. Found at https://www.sos.ca.gov/media
-r = requests.get("https://api.sos.ca.gov/returns/ballot-measures")
+r = http_cache.get("https://api.sos.ca.gov/returns/ballot-measures")
 
 #Call the API
 r.raise_for_status()
@@ -27,11 +35,17 @@ json_props = json.dumps(props, indent=4)
 #Set the time zone to Pacific Time
 pacific_tz = pytz.timezone('US/Pacific')
 
+#Every race and measure we grab this run, in the same format as every other source, for the Parquet dataset (see results_dataset.py)
+fetched_at = datetime.datetime.now(tz=pacific_tz).isoformat()
+cycle_rows = normalize.cal_prop_rows(props, fetched_at)
+
 #Set the current date and time
 timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Create a JSON file with the latest results and the current date and time
 latest_prop_name = f"jsons/california_props_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_prop_name)
 
 #Write the JSON results to the file
 with open(latest_prop_name, "w") as outfile:
@@ -115,19 +129,22 @@ print("California Proposition data updated in Datawrapper")
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. Found at https://www.sos.ca.gov/media.
 #You will also need to change the race IDs to reflect the races you want to grab for the current election. I found those in the API Endpoints CSV file provided by the Cal SOS.
 #The first half of the document had api's with words, and those correspond to another URL in the second half with a number for that race. They're both in the same order, so find the matching URL.
-r = requests.get('https://api.sos.ca.gov/returns/query?r=["13000001000059","13000002000059","13000003000059","12000001000059"]')
+r = http_cache.get('https://api.sos.ca.gov/returns/query?r=["13000001000059","13000002000059","13000003000059","12000001000059"]')
 
 #Call the API
 r.raise_for_status()
 
 #Gather the JSON results from the API request
 cal_cands = r.json()
+cycle_rows += normalize.cal_sos_rows(cal_cands, fetched_at)
 
 #Dump the JSON results to a readable format
 cal_json = json.dumps(cal_cands, indent=4)
 
 #Set the filename of the JSON to the current date and time
 latest_cal_name = f"jsons/california_cands_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_cal_name)
 
 #Write the JSON results to the file
 with open(latest_cal_name, "w") as outfile:
@@ -209,18 +226,21 @@ print("California State Legislature data updated in Datawrapper")
 #Set the URL to the call the Oregon results API for all statewide measures
 #NOTE: This API URL may change for future elections, so you will need to update it to the correct URL for the current election. Reach out to the PIO for the Oregon SOS before the election. They did not have documentation available for the data feed. Also check the readme for a guide
 # I found the right code by messing around with the URL and seeing what worked. I found that getting the type right was important, it matched up with the type in the URL of the https://results.oregonvotes.gov webpage. The other categories are all needed or results won't show up. Party can be changed to "DEM" or "REP" 
-r = requests.get("https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=MEASURE&category=SW&raceID=0&osn=0&county=0&party=0")
+r = http_cache.get("https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=MEASURE&category=SW&raceID=0&osn=0&county=0&party=0")
 
 #Call the API
 r.raise_for_status()
 # Parse the JSON response
 measures = r.json()
+cycle_rows += normalize.oregon_rows(measures, fetched_at)
 
 # Convert the JSON data to a formatted string
 json_measures = json.dumps(measures, indent=4)
 
 # Define the filename for the JSON data with the current timestamp
 latest_measure_name = f"jsons/oregon_measures_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_measure_name)
 
 # Write the JSON data to a file
 with open(latest_measure_name, "w") as outfile:
@@ -331,6 +351,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_stwide_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -352,13 +374,9 @@ with open(csv_filename, mode='w', newline='') as file:
 for raceids in oregon_ids:
     #Set the URL to the Oregon SOS API for the statewide results
     #NOTE: Change this API URL to the correct one for the current election, which could change in the future.
-    r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=SWPAR&category=SW&raceID={raceids}&osn=0&county=0&party=0")
-
-    #Call the API
-    r.raise_for_status()
-
-    #Gather the JSON results from the API request
-    a_data = r.json()
+    #Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+    a_data = oregon_index.get_race(raceids, "SWPAR", category="SW")
+    cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
     #If there is a file with the latest data, update it with the new data
     if os.path.isfile(latest_file_name):
@@ -424,6 +442,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_leg_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file with the latest data
 csv_filename = "oregon_leg_results.csv"
@@ -435,18 +455,15 @@ csv_headers = ["Race", "Candidate", "Party", "Votes", "Percent"]
 for raceid in oregon_ids:
     #Print the current Race id we're working on
     print("raceid:"+raceid)
-    #Convert the raceID to an integer, and if it's greater than 300031536, it's a house race, otherwise, set the URL to a Senate race
-    #NOTE: This is a bit of a stupid way to do this, but it works. You may need to change it depending on the raceids used. Here, the first house race starts at 300031536, so I used that as the cutoff.
+    #Get the race from the Oregon bulk listing, which has both House and Senate races, so no need to pick the type. See oregon_index.py
+    #If the race isn't in the bulk listing, it's requested by itself. Then, if the raceID is greater than 300031536, it's a house race, otherwise it's a Senate race
+    #NOTE: You may need to change the cutoff depending on the raceids used. Here, the first house race starts at 300031536, so I used that as the cutoff.
     if int(raceid) >= 300031536:
-        r = requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=HOUSE&category=SW&raceID={raceid}&osn=0&county=0&party=0")
+        fallback_type = "HOUSE"
     else:
-        r = requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=SENATE&category=SW&raceID={raceid}&osn=0&county=0&party=0")
-
-    #Call the API
-    r.raise_for_status()
-
-    #Gather the JSON results from the API request
-    a_data = r.json()
+        fallback_type = "SENATE"
+    a_data = oregon_index.get_race(raceid, fallback_type, category="SW")
+    cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
     #If there is a file with the latest data, update it with the new data
     if os.path.isfile(latest_file_name):
@@ -526,13 +543,16 @@ dw.publish_chart("2pT4G")
 
 print("Oregon State Legislature data updated in Datawrapper")
 
-# Delete any JSON files in the directory that are older than 24 hours
-now = datetime.datetime.now(tz=pacific_tz)
-for filename in os.listdir('jsons/.'):
-    if filename.endswith('.json'):
-        file_time = datetime.datetime.fromtimestamp(os.path.getmtime(f'jsons/{filename}'), tz=pacific_tz)
-        if (now - file_time).total_seconds() > 24 * 3600:
-            os.remove(f'jsons/{filename}')
-            print(f"Deleted old file: {filename}")
+#Add this run's results to the Parquet dataset
+results_dataset.write_cycle(cycle_rows)
+
+#And to the results database, so we can see how each contest changed through the night. See results_db.py
+#NOTE: Change the election name for a new election
+results_db.save_cycle(cycle_rows, "2024-general")
 
+#And to the election's results bundle, one file with every contest in it. See results_bundle.py
+results_bundle.write(cycle_rows, "2024-general")
 
+#Thin out the old JSON snapshots: keep everything from the last hour, then one every 15 minutes, then one an hour,
+#and put anything older than a day into a compressed archive for each source. See retention.py
+retention.prune()
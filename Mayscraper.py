@@ -10,6 +10,15 @@
 #Import the required packages
 import requests, datetime, json, csv, re, os, pytz, pandas as pd
 
+import normalize, oregon_index, profiling, results_bundle, results_dataset, results_db, retention
+
+#Run with --profile to save a profile of this run to profiles/. See profiling.py
+profiling.start_if_requested()
+
+#The requests all go through oregon_index.py, which caches them with http_cache.py
+#When working on the charts cell by cell, set NOTEBOOK_CACHE=300 (or run import http_cache; http_cache.interactive(300) in a cell)
+#so that re-running a cell reuses what it fetched in the last 5 minutes instead of asking the SOS again
+
 #Set the time zone to Pacific Time
 pacific_tz = pytz.timezone('US/Pacific')
 
@@ -28,6 +37,10 @@ dw = Datawrapper(dw_key)
 #Set the latest time and date
 latest_time = datetime.datetime.now(tz=pacific_tz).strftime("%m/%d/%Y, %I:%M %p")
 
+#Every Oregon race we grab this run, in the same format as every other source, for the Parquet dataset (see results_dataset.py)
+cycle_rows = []
+fetched_at = datetime.datetime.now(tz=pacific_tz).isoformat()
+
 # %%
 # Grab the local ballot measures in Oregon
 
@@ -37,6 +50,8 @@ if not os.path.exists('jsons'):
 
 # Define the filename for the JSON data with the current timestamp
 latest_file_name = f"jsons/oregon_measures_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 # Define the CSV filename
 csv_filename = "oregon_measure_results.csv"
@@ -51,12 +66,9 @@ with open(csv_filename, mode='w', newline='') as file:
 
 #Grab the statewide measure data
 #This is for Measure 102, the gas tax.
-r = requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=MEASURE&category=SW&raceID=300001646&osn=0&county=0&party=0")
-
-#Call the API
-r.raise_for_status()
-# Parse the JSON response
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300001646", "MEASURE", category="SW")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
 # Convert the JSON data to a formatted string
 json_measures = json.dumps(a_data, indent=4)
@@ -125,12 +137,9 @@ for measure in measures[:1]:
         })
 
 #This is for The Ashland School District measure
-r = requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=CTYALL&category=CTY&raceID=300001691&osn=0&county=0&party=0")
-
-#Call the API
-r.raise_for_status()
-# Parse the JSON response
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300001691", "CTYALL", category="CTY")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
 # Convert the JSON data to a formatted string
 json_measures = json.dumps(a_data, indent=4)
@@ -209,12 +218,9 @@ oregon_measure_ids = ["300001668" , "300001682"]
 # I found the right code by messing around with the URL and seeing what worked. I found that getting the type right was important, it matched up with the type in the URL of the https://results.oregonvotes.gov webpage. The other categories are all needed or results won't show up. Party can be changed to "DEM" or "REP" 
 
 for raceids in oregon_measure_ids:
-    r = requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=LMEA&category=CTY&raceID={raceids}&osn=0&county=0&party=0&map=CTY")
-
-    #Call the API
-    r.raise_for_status()
-    # Parse the JSON response
-    a_data = r.json()
+    #Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+    a_data = oregon_index.get_race(raceids, "LMEA", category="CTY", extra="&map=CTY")
+    cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
     # Convert the JSON data to a formatted string
     json_measures = json.dumps(a_data, indent=4)
@@ -330,6 +336,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_CD2_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -346,13 +354,9 @@ with open(csv_filename, mode='w', newline='') as file:
 #Democratic Primary
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=FED&category=SW&raceID=300037829&osn=0&county=0&party=DEM")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037829", "FED", category="SW", party="DEM")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="DEM")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -406,13 +410,9 @@ print(f"Oregon CD2 DEM Candidate races data written to {csv_filename}")
 #Republican primary
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=FED&category=SW&raceID=300037830&osn=0&county=0&party=REP")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037830", "FED", category="SW", party="REP")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="REP")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -498,6 +498,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_GOV_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -514,13 +516,9 @@ with open(csv_filename, mode='w', newline='') as file:
 #Republican Primary
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=SWPAR&category=SW&raceID=300037840&osn=0&county=0&party=REP")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037840", "SWPAR", category="SW", party="REP")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="REP")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -572,13 +570,9 @@ print(f"Oregon GOV REP Candidate races data written to {csv_filename}")
 
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=SWPAR&category=SW&raceID=300037839&osn=0&county=0&party=DEM")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037839", "SWPAR", category="SW", party="DEM")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="DEM")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -665,6 +659,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_SEN_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -681,13 +677,9 @@ with open(csv_filename, mode='w', newline='') as file:
 #Democratic Primary
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=FED&category=SW&raceID=300037825&osn=0&county=0&party=DEM")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037825", "FED", category="SW", party="DEM")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="DEM")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -740,13 +732,9 @@ print(f"Oregon DEM Senate Candidate races data written to {csv_filename}")
 #Republican Primary
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=FED&category=SW&raceID=300037826&osn=0&county=0&party=REP")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037826", "FED", category="SW", party="REP")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="REP")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -833,6 +821,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_STSEN_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -848,13 +838,9 @@ with open(csv_filename, mode='w', newline='') as file:
 
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=SENATE&category=SW&raceID=300037841&osn=0&county=0&party=DEM")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300037841", "SENATE", category="SW", party="DEM")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at, party="DEM")
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -936,6 +922,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_JoCo_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -955,13 +943,9 @@ race_ids = ["300038070", "300038071"]
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
 for race_id in race_ids:
-    r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=CTYALL&category=CTY&raceID={race_id}&osn=0&county=0&party=0")
-
-    #Call the API
-    r.raise_for_status()
-
-    #Gather the JSON results from the API request
-    a_data = r.json()
+    #Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+    a_data = oregon_index.get_race(race_id, "CTYALL", category="CTY")
+    cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
     #If there is a file with the latest data, update it with the new data
     if os.path.isfile(latest_file_name):
@@ -1048,6 +1032,8 @@ timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
 #Set the filename for the JSON file with the latest data and time
 latest_file_name = f"jsons/oregon_Curry_{timenow}.json"
+#Track the snapshot so retention.py knows when to thin it out or archive it
+retention.register(latest_file_name)
 
 #Set the filename for the CSV file
 #NOTE: We are using the same CSV file for both the statewide and state legislature races because they're on the same graph. Change the CSV filename if you want to separate them.
@@ -1064,13 +1050,9 @@ with open(csv_filename, mode='w', newline='') as file:
 #Set the URL to the Oregon SOS API for the statewide results
 #NOTE: Change this API URL to the correct one for the current election, which could change in the future. See README for details on Oregon URLs
 
-r= requests.get(f"https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData?type=CTYALL&category=CTY&raceID=300034738&osn=0&county=0&party=0")
-
-#Call the API
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-a_data = r.json()
+#Get the race from the Oregon bulk listing, or request it by itself if it isn't there. See oregon_index.py
+a_data = oregon_index.get_race("300034738", "CTYALL", category="CTY")
+cycle_rows += normalize.oregon_rows(a_data, fetched_at)
 
 #If there is a file with the latest data, update it with the new data
 if os.path.isfile(latest_file_name):
@@ -1145,16 +1127,16 @@ print("Curry County Commissioner races data updated in Datawrapper")
 
 #%%
 
-# Delete any JSON files in the directory that are older than 24 hours
-now = datetime.datetime.now(tz=pacific_tz).strftime("%m-%d")
-print(f"Checking for old files to delete...")
-print(f"Current date: "+now)
-for filename in os.listdir('jsons/.'):
-	print(f"Checking file: "+filename)
-	if filename.endswith('.json'):
-		file_date = re.search("-(\d{2}-\d{2})", filename)
-		if file_date.group(1) != now:
-			os.remove(f'jsons/{filename}')
-			print(f"Deleted old file: {filename}")
-		else:
-			print(f"File is current, not deleting: {filename}")
\ No newline at end of file
+#Add this run's results to the Parquet dataset
+results_dataset.write_cycle(cycle_rows)
+
+#And to the results database, so we can see how each contest changed through the night. See results_db.py
+#NOTE: Change the election name for a new election
+results_db.save_cycle(cycle_rows, "2025-may-primary")
+
+#And to the election's results bundle, one file with every contest in it. See results_bundle.py
+results_bundle.write(cycle_rows, "2025-may-primary")
+
+#Thin out the old JSON snapshots: keep everything from the last hour, then one every 15 minutes, then one an hour,
+#and put anything older than a day into a compressed archive for each source. See retention.py
+retention.prune()
@@ -0,0 +1,166 @@
+# "Compared with last time" numbers for every contest, from a past election's final results.
+# The baseline is built once, before election night, from one of:
+#   - the results database (results.db, see results_db.py): the last count of every contest in that election
+#   - a results bundle (results/<election>.csv, see results_bundle.py)
+#   - an official results file (a CSV with Contest, Candidate, Party and Votes columns, and optionally Source and County)
+# and saved to baseline.json, with the votes for every candidate, party and county in each contest, looked up by source and
+# contest name, since contests in different counties or states can have the same name.
+# A results file without a Source column is all from one source, given with --source (ca_sos by default).
+# The scraper loads it when it starts, and each run adds these columns to every candidate:
+#   Baseline Votes, Baseline %        - the candidate's votes and share last time, if they ran
+#   Swing                             - the change in their share, in points. Shares are worked out from the votes both times,
+#                                       not the rounded percentages the APIs give, so they compare exactly
+#   Party %, Baseline Party %, Party Swing - the same for all of the candidate's party's candidates together
+#   Turnout vs Baseline %             - the votes counted so far in the contest, as a percent of the total last time
+# Usage:
+#   python baseline.py build 2022-ca-primary --db                 # or --bundle, or --csv official_results.csv --source ca_sos
+#   lookup = baseline.load()                                      # None if there's no baseline.json
+#   lookup.save_comparison(cycle_rows)                            # writes baseline_comparison.csv
+# Licensed under a GNU General Public License v3.0
+
+import argparse, json, os, numpy as np, pandas as pd
+
+import results_bundle, results_db
+
+BASELINE_FILE = "baseline.json"
+COMPARISON_FILE = "baseline_comparison.csv"
+
+#The source an official results file is from, if it doesn't have a Source column (see normalize.py for the source names)
+DEFAULT_SOURCE = "ca_sos"
+
+#Contests that are named differently this time, {(source, name now): name in the baseline}
+#NOTE: Add contests here if the name changed since the baseline election (e.g. after redistricting)
+CONTEST_NAMES = {}
+
+
+#Total up the votes for each contest, candidate, party and county, as the dict saved to baseline.json
+#df has Contest, Candidate, Party and Votes columns, and optionally Source and County. Without a County column the rows are contest totals
+def _index(df, election, source=DEFAULT_SOURCE):
+    if "Source" not in df.columns:
+        df = df.assign(Source=source)
+    df = df.assign(Party=df["Party"].fillna(""), Votes=pd.to_numeric(df["Votes"], errors="coerce").fillna(0).astype(int))
+    sources = {}
+    for (source, contest), contest_df in df.groupby(["Source", "Contest"], sort=True):
+        entry = {
+            "total": int(contest_df["Votes"].sum()),
+            "candidates": {name: int(votes) for name, votes in contest_df.groupby("Candidate")["Votes"].sum().items()},
+            "parties": {name: int(votes) for name, votes in contest_df.groupby("Party")["Votes"].sum().items() if name},
+        }
+        if "County" in contest_df.columns:
+            entry["counties"] = {county.lower(): int(votes) for county, votes in contest_df.groupby("County")["Votes"].sum().items()}
+        sources.setdefault(source, {})[contest] = entry
+    return {"election": election, "sources": sources}
+
+
+#The last count of every contest in an election, from the results database
+def _from_db(election):
+    df = results_db.final(election)[["source", "contest", "candidate", "party", "votes"]]
+    return df.rename(columns={"source": "Source", "contest": "Contest", "candidate": "Candidate", "party": "Party", "votes": "Votes"})
+
+
+def _from_bundle(election):
+    df = pd.DataFrame(results_bundle.load(election))
+    return df.rename(columns={"source": "Source", "contest": "Contest", "candidate": "Candidate", "party": "Party", "votes": "Votes"})
+
+
+#Build the baseline and save it. source is "db", "bundle", or the path of an official results CSV
+#results_source is the source the CSV's contests are from, if it doesn't have a Source column
+def build(election, source, filename=BASELINE_FILE, results_source=DEFAULT_SOURCE):
+    if source == "db":
+        df = _from_db(election)
+    elif source == "bundle":
+        df = _from_bundle(election)
+    else:
+        df = pd.read_csv(source)
+    if df.empty:
+        raise ValueError(f"No results for {election} in {source}")
+    baseline = _index(df, election, results_source)
+    with open(filename, "w") as f:
+        json.dump(baseline, f, indent=1, ensure_ascii=False)
+    print(f"Saved a baseline of {sum(len(contests) for contests in baseline['sources'].values())} contests from {election} to {filename}")
+    return baseline
+
+
+class Baseline:
+    def __init__(self, baseline):
+        self.election = baseline["election"]
+        #{(source, contest): entry}
+        self.contests = {(source, contest): entry for source, contests in baseline["sources"].items()
+                         for contest, entry in contests.items()}
+        #Turn the lookup into tables once, so each run only has to join against them
+        self.totals = pd.DataFrame([(source, contest, entry["total"]) for (source, contest), entry in self.contests.items()],
+                                   columns=["Source", "Baseline Contest", "Baseline Total"])
+        self.candidates = self._shares("candidates", "Candidate", "Baseline Votes", "Baseline %")
+        self.parties = self._shares("parties", "Party", "Baseline Party Votes", "Baseline Party %")
+
+    def _shares(self, key, column, votes_column, share_column):
+        records = [(source, contest, name, votes, votes / entry["total"] * 100 if entry["total"] else np.nan)
+                   for (source, contest), entry in self.contests.items() for name, votes in entry[key].items()]
+        return pd.DataFrame(records, columns=["Source", "Baseline Contest", column, votes_column, share_column])
+
+    #This run's rows (see normalize.py) with the baseline columns added
+    #Percent is each candidate's share of the votes counted so far, worked out the same way as the baseline shares
+    def compare(self, rows):
+        df = pd.DataFrame(rows, columns=["source", "contest", "candidate", "party", "votes"])
+        df.columns = ["Source", "Contest", "Candidate", "Party", "Votes"]
+        df["Baseline Contest"] = [CONTEST_NAMES.get((source, contest), contest) for source, contest in zip(df["Source"], df["Contest"])]
+        total = df.groupby(["Source", "Contest"])["Votes"].transform("sum")
+        #Contests with no votes yet have no share instead of dividing by zero
+        df["Percent"] = df["Votes"] / total.where(total > 0) * 100
+        df = df.merge(self.candidates, on=["Source", "Baseline Contest", "Candidate"], how="left")
+        df["Swing"] = np.round(df["Percent"] - df["Baseline %"], 2)
+
+        df["Party %"] = df.groupby(["Source", "Contest", "Party"])["Percent"].transform("sum", min_count=1)
+        df = df.merge(self.parties, on=["Source", "Baseline Contest", "Party"], how="left")
+        df["Party Swing"] = np.round(df["Party %"] - df["Baseline Party %"], 2)
+
+        df = df.merge(self.totals, on=["Source", "Baseline Contest"], how="left")
+        df["Turnout vs Baseline %"] = np.round(df.groupby(["Source", "Contest"])["Votes"].transform("sum") / df["Baseline Total"] * 100, 1)
+        for column in ["Percent", "Baseline %", "Party %", "Baseline Party %"]:
+            df[column] = np.round(df[column], 2)
+        return df.drop(columns=["Baseline Contest", "Baseline Party Votes", "Baseline Total"])
+
+    def save_comparison(self, rows, filename=COMPARISON_FILE):
+        df = self.compare(rows)
+        df.to_csv(filename, index=False)
+        print(f"Compared {df['Contest'].nunique()} contests with {self.election}, saved to {filename}")
+        return df
+
+    #A contest's total votes in a county last time, or None if the baseline doesn't have it
+    def county_total(self, source, contest, county):
+        entry = self.contests.get((source, CONTEST_NAMES.get((source, contest), contest)))
+        if entry is None:
+            return None
+        return entry.get("counties", {}).get(county.lower())
+
+
+#Load the baseline, or return None if there isn't one
+def load(filename=BASELINE_FILE):
+    if not os.path.isfile(filename):
+        return None
+    with open(filename) as f:
+        baseline = json.load(f)
+    if "sources" not in baseline:
+        print(f"{filename} was built before contests were kept apart by source, build it again with python baseline.py build")
+        return None
+    baseline = Baseline(baseline)
+    print(f"Loaded the {baseline.election} baseline for {len(baseline.contests)} contests")
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the baseline to compare this election's results with")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("election", help="The election to compare with, e.g. 2022-ca-primary")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", action="store_true", help="Use the last count of each contest in results.db")
+    source.add_argument("--bundle", action="store_true", help="Use the election's results bundle in results/")
+    source.add_argument("--csv", help="Use an official results file with Contest, Candidate, Party, Votes (and Source, County) columns")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="The source of the --csv contests if it has no Source column, e.g. ca_sos or clarity_shasta")
+    parser.add_argument("--out", default=BASELINE_FILE, help="Where to save the baseline")
+    args = parser.parse_args()
+    build(args.election, "db" if args.db else "bundle" if args.bundle else args.csv, args.out, args.source)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,146 +4,115 @@
 # Licensed under a GNU General Public License v3.0
 # Code written by Roman Battaglia, 2024.
 
-import requests, datetime, json, csv, re, os, pytz, time, pandas as pd
+import requests, datetime, json, csv, re, os, sys, pytz, time, pandas as pd
 from datawrapper import Datawrapper
 
+import baseline, clarity, cycle_outputs, diff, freshness, leader, normalize, pipeline, profiling, retention, scheduler, shard, streaming, validate
+
+#Run with --profile to save a profile of this run to profiles/. See profiling.py
+profiling.start_if_requested()
+
+#Run with --shard i/N to only write and publish this worker's share of the contests. See shard.py
+#Shard 0 (or an unsharded run) is the lead, and also does the steps that need every contest
+current_shard = shard.from_argv()
+lead = shard.is_lead(current_shard)
+
+#Run with "leader.py run" on two or more machines, so the charts keep updating if one of them goes down. It renews the lease
+#while this runs, and gives us --lease, --node and so on. Only the run holding the lease fetches and publishes, a run that
+#doesn't have it stops here. See leader.py
+#The contest states and validation holds are kept next to the lease, so a standby that takes over starts where the leader stopped
+lease = leader.from_argv(shard.state_file(current_shard, "calprimary"))
+state_dir = ""
+if lease is not None:
+    if not lease.acquire():
+        print(f"Standing by, the lease in {lease.filename} is held by another machine")
+        sys.exit(0)
+    state_dir = os.path.dirname(os.path.abspath(lease.filename))
+
+#Start the clock. Everything has to be done before the deadline (the CYCLE_DEADLINE environment variable, in seconds),
+#so the charts are published in priority order and optional work is skipped if there isn't time. See scheduler.py
+cycle = scheduler.CycleScheduler()
+
+#Record when each changed contest was fetched, parsed, written and published, to see how fresh the charts really are. See freshness.py
+tracker = freshness.Tracker()
+
 #Set the timezone
 pacific_tz = pytz.timezone('US/Pacific')
 
 #Set the current date and time
 timenow = datetime.datetime.now(tz=pacific_tz).strftime("%Y-%m-%d_%H-%M")
 
+#The election name the results are saved under in the results database and bundle. See results_db.py
+#NOTE: Change the election name for a new election
+ELECTION = "2026-ca-primary"
+
 #Set the datawrapper API key from an environment variable for security
 dw_key = os.environ.get("DATAWRAPPER_API_KEY")
 
 #Setup the Datawrapper client
 dw = Datawrapper(dw_key)
 
+#What every contest looked like at the end of the last run, so we only republish the charts that changed. See diff.py
+previous = diff.load_state(os.path.join(state_dir, shard.state_file(current_shard, diff.STATE_FILE)))
+state = dict(previous)
+
+#Checks every contest before it's published, and holds back the ones with bad data (votes going down and so on). See validate.py
+gate = validate.Gate(os.path.join(state_dir, shard.state_file(current_shard, validate.HOLDS_FILE)))
+
 #Create the JSON directory if it doesn't exist
 if not os.path.exists('jsons'):
     os.makedirs('jsons')
 
-# Grab the statewide results
-r = requests.get('https://api.sos.ca.gov/returns/query?r=["02000000000059", "03000000000059", "04000000000059", "07000000000059", "11000001000059", "11000002000059", "12000002000059", "13000001000059", "13000002000059"]')
-
-r.raise_for_status()
-
-#Gather the JSON results from the API request
-cal_cands = r.json()
-
-#Dump the JSON results to a readable format
-cal_json = json.dumps(cal_cands, indent=4)
-
-#Set the filename of the JSON to the current date and time
-latest_cal_name = f"jsons/california_cands_{timenow}.json"
-
-#Write the JSON results to the file
-with open(latest_cal_name, "w") as outfile:
-    json.dump(cal_cands, outfile)
-
-print(f"Full statewide results saved to {latest_cal_name}")
-
-#Load the JSON file we just created
-with open(latest_cal_name) as f:
-    data = json.load(f)
-
-# Iterate through each contest int he JSON data
-for contst in data:
-    # Set the name of the CSV file to match the contest, using regex to clean up the name
-    csv_filename = f"California_{contst['raceTitle'].split('-', 1)[0].strip().replace(' ', '_').replace('.', '')}_results.csv"
-    # Open the CSV file for writing
-    with open(csv_filename, 'w', newline='') as file:
-        # Write the header row
-        csv_headers = ["Candidate", "Party", "Votes", "Percent"]
-        writer = csv.DictWriter(file, fieldnames=csv_headers)
-        writer.writeheader()
-        # Iterate through the candidates in the contest and write their data to the CSV
-        for cand in contst['candidates']:
-            # Determine the candidate's name and incumbency
-            if cand.get("incumbent") == True:
-                name = cand.get("Name") + " (Incumbent)"
-            else:
-                name = cand.get("Name")
-            # Determine the candidate's party affiliation
-            if cand.get("Party") == "Dem":
-                party = "Democratic"
-            elif cand.get("Party") == "Rep":
-                party = "Republican"
-            elif cand.get("Party") == "NPP":
-                party = "No Party Preference"
-            elif cand.get("Party") == "Lib":
-                party = "Libertarian"
-            elif cand.get("Party") == "P&F":
-                party = "Peace and Freedom"
-            elif cand.get("Party") == "Grn":
-                party = "Green"
-
-            votes = cand.get("Votes").replace(",", "")
-
-            percent = cand.get("Percent")
-            #Write the collected data to the CSV file
-            writer.writerow({
-                "Candidate": name, 
-                "Party": party, 
-                "Votes": votes, 
-                "Percent": percent
-            })
-
-    print(f"Saved {contst['raceTitle'].split('-', 1)[0].strip()} results to {csv_filename}")
-
+#open the JSON files with the list of CSV files and their corresponding Datawrapper chart keys
+#NOTE: The priorities, and which charts are required, are set in calraces.json and shastaraces.json
 with open('calraces.json') as f:
     calraces = json.load(f)
 
-latest_time = datetime.datetime.now(tz=pacific_tz).strftime("%m/%d/%Y, %I:%M %p")
+#The Clarity counties, with their watched contests and charts (Shasta's are in watched_contests.txt and shastaraces.json)
+#NOTE: The election IDs change every election. See clarity.py and the readme
+counties = clarity.load_counties()
 
-# Update the Datawrapper charts with the new data
-for race in calraces:
-    print(f"Updating {race.get('filename')}")
-    try:
-        new_data = pd.read_csv(race.get("filename"), encoding="utf-8-sig")
-    except UnicodeDecodeError:
-        new_data = pd.read_csv(race.get("filename"), encoding="cp1252")
-    metadata = {
-                "annotate": {
-                    #NOTE: Change "PST" to "PDT" if the current time is in Daylight Saving Time
-                    "notes": f"Last updated: {latest_time} PDT"
-                }
-            }
-    chart_id = race.get("Key")
-    dw.add_data(chart_id=chart_id, data=new_data)
-    dw.update_metadata(chart_id=chart_id, metadata=metadata)
-    dw.publish_chart(chart_id=chart_id)
+#The results from the last comparable election, if baseline.json has been built (python baseline.py build ...). See baseline.py
+baseline_lookup = baseline.load()
 
-# %%
-# Update the Shasta County results with the same process as above, but with a different API endpoint
-#import requests, time, json, datetime, csv
+#Set the latest time for the annotation in the Datawrapper charts, and the time for the normalized rows
+latest_time = datetime.datetime.now(tz=pacific_tz).strftime("%m/%d/%Y, %I:%M %p")
+fetched_at = datetime.datetime.now(tz=pacific_tz).isoformat()
 
 s = requests.Session()
-
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:151.0) Gecko/20100101 Firefox/151.0',
-    'Accept': 'application/json, text/plain, */*',
-    'Accept-Language': 'en-US,en;q=0.9',
-    'Accept-Encoding': 'gzip, deflate, br, zstd',
-    'Connection': 'keep-alive',
-    'Sec-Fetch-Dest': 'empty',
-    'Sec-Fetch-Mode': 'cors',
-    'Sec-Fetch-Site': 'same-origin',
-    'Sec-GPC': '1',
-    'Upgrade-Insecure-Requests': '1', # You can add more headers if needed
-}
-
-url = "https://results.enr.clarityelections.com/CA/Shasta/126486/374094/json/en/summary.json"
-
-#Make the request with retries for handling 202 responses and other potential errors
-r = s.get(url, headers=headers)
-r.raise_for_status()
-print(r.status_code)
-if not r.content:
-    print("There's no data available")
-else:
-     print("Request successful")
-
+#Enough connections for every Clarity county at once, since they're all on the same host
+s.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(10, len(counties) + 2)))
+
+#Where the chart CSVs are written. The workflow sets CSV_DIR to build/, which isn't committed, and commits the results bundle instead (see results_bundle.py)
+csv_dir = os.environ.get("CSV_DIR", ".")
+if not os.path.exists(csv_dir):
+    os.makedirs(csv_dir)
+
+#The sources, and how to fetch, save, normalize and write each one. See streaming.py
+#NOTE: The statewide API URL is set in pipeline.py. The Clarity election IDs are set in clarity_counties.json and change every election
+#Only the lead saves snapshots, so the shards don't all save the same thing (see shard.py)
+sources = [
+    {"name": "statewide",
+     "fetch": lambda: pipeline.fetch_statewide(timeout=cycle.timeout()),
+     "save": (lambda data: pipeline.save_snapshot(data, "california_cands", timenow)) if lead else None,
+     "rows": lambda data: normalize.cal_sos_rows(data, fetched_at),
+     "write": lambda rows: pipeline.write_statewide_csvs(rows, csv_dir),
+     "csv_name": pipeline.statewide_csv_name,
+     "races": calraces,
+     "updated": normalize.cal_updated_times},
+]
+#Each Clarity county is its own source, so they're all fetched at the same time. Only their watched contests are kept
+for county in counties:
+    sources.append({
+        "name": f"{county['county']} County",
+        "fetch": lambda county=county: clarity.fetch(county, s, timeout=cycle.timeout()),
+        "save": (lambda data, county=county: pipeline.save_snapshot(data, clarity.snapshot_prefix(county), timenow)) if lead else None,
+        "rows": lambda data, county=county: normalize.clarity_rows(data, fetched_at, county["county"], county["watched_contests"]),
+        "write": lambda rows, county=county: pipeline.write_shasta_csvs(rows, csv_dir, clarity.csv_namer(county)),
+        "csv_name": clarity.csv_namer(county),
+        "races": county["races"],
+        "check": lambda data, county=county: validate.clarity_problems(data, clarity.source_name(county)),
+        "updated": lambda data, county=county: {contest["C"]: clarity.updated_at(county) for contest in data}})
 
 #This is old code for making the requests that seemed to not work as well.
 """
@@ -186,106 +155,61 @@ if not r.content:
     print("There's no data available")
 """
 
-#Converts the raw data to a JSON file
-data = r.json()
-
-# parses the raw python data into JSON data
-json_object = json.dumps(data, indent=4)
-
-# set the current date and time
-timenow = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
-
-#set the name of the file
-latest_file_name = f"jsons/shasta_results_{timenow}.json"
-
-# write output to file
-with open(latest_file_name, "w") as outfile:
-    json.dump(data, outfile)
-
-#Print out the name of the latest file
-print("Latest filename:", latest_file_name)
-
-# Read the watched contests
-with open('watched_contests.txt', 'r') as f:
-     watched_contests = [line.strip() for line in f.readlines()]
-
-# Open the JSON file
-with open(latest_file_name, 'r') as f:
-     data = json.load(f)
-
-# Iterate through the JSON data
-for contest in data:
-     # If the contest's name is in the watched contests list
-     if contest['C'] in watched_contests:
-          # Extract the 'C', 'CH', 'PCT', and 'V' values
-          c_value = contest.get('C')
-          #Convert the candidate names to title case for better readability in the CSV
-          ch_value = [name.title() for name in contest.get('CH', [])]
-          pct_value = contest.get('PCT')
-          v_value = contest.get('V')
-
-          # Prepare the data for writing to CSV
-          rows = zip(ch_value, v_value, pct_value)
-
-          # Set the name of the CSV file to match the contest
-          clean_name = f"{c_value}_results_clean.csv"
-
-          # Write to CSV
-          with open(clean_name, 'w', newline='') as f:
-               writer = csv.writer(f)
-               #Check if the contest is a measure, which will use a different header.
-               if c_value == "Measure B":
-                    writer.writerow(["Result", "Votes", "Percent"]) # Write header for measure
-               else:
-                    writer.writerow(["Candidate", "Votes", "Percent"])  # Write header
-               for row in rows:
-                    writer.writerow(row)  # Write data rows
 
 # %%
-#Update the datawrapper charts
-
-#open the JSON file with the list of CSV files and their corresponding Datawrapper chart keys
-with open('shastaraces.json') as f:
-    calraces = json.load(f)
+#Fetch every source at once, and publish each changed contest's chart as soon as it's written, most important first,
+#while the other sources are still being fetched. Only the rows for this shard (all of them if we aren't sharded) are checked,
+#written and published, and only they are in cycle_rows
+result = streaming.run_cycle(sources, dw, previous, latest_time, cycle=cycle, tracker=tracker,
+                             select=lambda rows: shard.filter_rows(rows, current_shard), out_dir=csv_dir, gate=gate)
+cycle_rows = result["rows"]
+state.update(result["states"])
+gate.save()
+if result["held"]:
+    print(f"Held back {len(result['held'])} contests, they'll be checked again next run: {', '.join(contest for source, contest in result['held'])}")
+
+#The charts are published, so save what each contest looks like for the next run to compare with
+#With a lease, check it's still ours first
+if lease is not None and not lease.acquire():
+    print("Lost the lease during this run, another machine may have published some of the same charts")
+diff.save_state(state, os.path.join(state_dir, shard.state_file(current_shard, diff.STATE_FILE)))
+
+#Add this run's times to freshness_log.csv and update freshness_histograms.csv
+#A shard keeps its own log, and shard.py merge adds it to the main one
+if current_shard is None:
+    tracker.save()
+else:
+    tracker.save(shard.freshness_log(current_shard), histogram_file=None)
 
-#Set the latest time for the annotation in the Datawrapper charts
-latest_time = datetime.datetime.now(tz=pacific_tz).strftime("%m/%d/%Y, %I:%M %p")
+# %%
+#Save the static results pages, projections, baseline comparison, Parquet dataset, results database and results bundle. See cycle_outputs.py
+#Only the contests that changed since the last run are added to the dataset and database.
+#A shard only has its own contests, so it saves its rows in its report instead, and shard.py merge does this with every shard's rows
+changed_contests = set(diff.compare(previous, cycle_rows)[1])
+if current_shard is None:
+    cycle_outputs.save(cycle_rows, changed_contests, ELECTION, baseline_lookup, cycle)
 
-# Update the Datawrapper charts with the new data
-for race in calraces:
-    print(f"Updating {race.get('filename')}")
-    # Try UTF-8 encoding first, then fall back to cp1252 if that fails (for files with special characters like accents)
-    try:
-        new_data = pd.read_csv(race.get("filename"), encoding="utf-8-sig") 
-    except UnicodeDecodeError:
-        new_data = pd.read_csv(race.get("filename"), encoding="cp1252")
-    #Update the metadata to include an annotation with the last updated time
-    metadata = {
-                "annotate": {
-                    #NOTE: Change "PST" to "PDT" if the current time is in Daylight Saving Time
-                    "notes": f"Last updated: {latest_time} PDT"
-                }
-            }
-    #Update chart data/metadata and publish in one call
-    chart_id = race.get("Key")
-    dw.add_data(chart_id=chart_id, data=new_data)
-    dw.update_metadata(chart_id=chart_id, metadata=metadata)
-    dw.publish_chart(chart_id=chart_id)
+# %%
+#County-by-county results for the contests in county_races.json, for choropleth maps
+#This is off by default, set the COUNTY_BREAKDOWN environment variable to 1 to turn it on
+if lead and os.environ.get("COUNTY_BREAKDOWN") == "1":
+    import county_results
+    if cycle.has_time("county breakdowns", county_results.FANOUT_BUDGET):
+        county_results.run(baseline=baseline_lookup)
 
 # %%
-#Delete any .json files older than 24 hours
-now = datetime.datetime.now(tz=pacific_tz).strftime("%m-%d")
-print(f"Checking for old files to delete...")
-print(f"Current date: "+now)
-#Iterate through all files in the JSON
-for filename in os.listdir('jsons/.'):
-	print(f"Checking file: "+filename)
-	if filename.endswith('.json'):
-        #Extract the month and day from the filename. All JSON filenames use the format "YYYY-MM-DD_HH-MM" at the end
-		file_date = re.search("-(\d{2}-\d{2})", filename)
-        #If the data doesn't match the current month and day, delete the file
-		if file_date.group(1) != now:
-			os.remove(f'jsons/{filename}')
-			print(f"Deleted old file: {filename}")
-		else:
-			print(f"File is current, not deleting: {filename}")
\ No newline at end of file
+#Thin out the old JSON snapshots: keep everything from the last hour, then one every 15 minutes, then one an hour,
+#and put anything older than a day into a compressed archive for each source. See retention.py
+if lead:
+    retention.prune()
+
+#List anything that was skipped to make the deadline
+cycle.report()
+
+#A shard saves its run report, with its rows, for shard.py merge
+if current_shard is not None:
+    shard.save_report(current_shard, cycle_rows, changed_contests, ELECTION, cycle)
+
+#If a source failed, fail the run once everything else is done, so the workflow shows it
+if result["errors"]:
+    raise result["errors"][0][1]
@@ -0,0 +1,102 @@
+# Results for every county that posts them on Clarity ENR (results.enr.clarityelections.com), not just Shasta.
+# The counties are listed in clarity_counties.json:
+#   {"county": "Shasta",                          # the county's name, used for the source name (clarity_shasta) and file names
+#    "path": "CA/Shasta",                         # the part of the Clarity URL before the election ID
+#    "election_id": "126486",                     # changes every election, see the readme
+#    "version": "374094",                         # optional, leave it out to always use the latest results
+#    "watched_contests": "watched_contests.txt",  # a list of contest names, or a file with one per line. Leave it out for every contest
+#    "races": "shastaraces.json",                 # the charts for this county, a list or a file like shastaraces.json
+#    "csv_prefix": ""}                            # optional, put in front of each CSV name. The default is "<county>_"
+# Clarity posts each update as a new version, so the latest version number is looked up first (current_ver.txt, checked
+# on every run through http_cache.py) and then that version's summary.json is fetched.
+# Each county is its own source in streaming.py, so all the counties are fetched at the same time over one session,
+# and adding more counties barely adds to the cycle time.
+# Licensed under a GNU General Public License v3.0
+
+import email.utils, json, os
+
+import http_cache, pipeline, profiling
+
+CONFIG_FILE = "clarity_counties.json"
+
+#The Last-Modified time of each county's latest summary.json, {source name: header}
+_last_modified = {}
+
+#NOTE: Clarity has moved domains before. Change this if the county results pages stop loading
+BASE_URL = "https://results.enr.clarityelections.com"
+
+
+#Read a setting that can be given as a list, or as the name of a file that has the list
+def _list_or_file(value):
+    if not isinstance(value, str):
+        return value
+    with open(value) as f:
+        if value.endswith(".json"):
+            return json.load(f)
+        return [line.strip() for line in f.readlines() if line.strip()]
+
+
+#Read clarity_counties.json, with the watched contests and chart lists loaded
+def load_counties(config_file=CONFIG_FILE):
+    if not os.path.isfile(config_file):
+        return []
+    with open(config_file) as f:
+        counties = json.load(f)
+    for county in counties:
+        county["watched_contests"] = _list_or_file(county.get("watched_contests"))
+        county["races"] = _list_or_file(county.get("races", []))
+    return counties
+
+
+#The source name the county's rows get (see normalize.clarity_rows), e.g. "clarity_shasta"
+def source_name(county):
+    return f"clarity_{county['county'].lower().replace(' ', '_')}"
+
+
+#What the county's snapshots in jsons/ are called, e.g. "shasta_results"
+def snapshot_prefix(county):
+    return f"{county['county'].lower().replace(' ', '_')}_results"
+
+
+#The CSV file for one of the county's contests. Shasta's are "<contest>_results_clean.csv", like they've always been
+def csv_namer(county):
+    prefix = county.get("csv_prefix", f"{county['county']}_")
+    return lambda contest: f"{prefix}{contest}_results_clean.csv"
+
+
+def _election_url(county):
+    return f"{BASE_URL}/{county['path']}/{county['election_id']}"
+
+
+#The number of the latest results Clarity has posted for the county
+def current_version(county, session=None, timeout=30):
+    if county.get("version"):
+        return str(county["version"])
+    r = http_cache.get(f"{_election_url(county)}/current_ver.txt", headers=pipeline.CLARITY_HEADERS, session=session, timeout=timeout)
+    r.raise_for_status()
+    return r.text.strip()
+
+
+#Grab a county's full summary from Clarity
+def fetch(county, session=None, timeout=30):
+    with profiling.tag(f"source={source_name(county)}"):
+        version = current_version(county, session, timeout)
+        r = http_cache.get(f"{_election_url(county)}/{version}/json/en/summary.json", headers=pipeline.CLARITY_HEADERS,
+                           session=session, timeout=timeout)
+        r.raise_for_status()
+        if not r.content:
+            print(f"There's no data available for {county['county']} County")
+            return []
+        _last_modified[source_name(county)] = r.headers.get("Last-Modified")
+        return r.json()
+
+
+#When Clarity last changed the county's summary.json we fetched (its Last-Modified header), as a unix time or None
+def updated_at(county):
+    header = _last_modified.get(source_name(county))
+    if not header:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return None
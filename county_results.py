@@ -0,0 +1,184 @@
+# County-by-county results for the watched contests, for choropleth maps.
+# Oregon: the county numbers come straight from the bulk listing in oregon_index.py, so there are no extra requests.
+#         Races that aren't in the bulk listing are requested one county at a time with the county= parameter.
+# California: the SOS API has a results page for each contest in each county. All 58 are requested at the same time.
+# The results for each contest are saved to county_results/<state>_<contest>_county_results.csv, with one row per county.
+# The contests are set in county_races.json
+# Usage: python county_results.py
+# Licensed under a GNU General Public License v3.0
+
+import json, os, time, requests, numpy as np, pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FanOutTimeout
+
+import http_cache, normalize, oregon_index
+
+#NOTE: This may change for future elections. The county endpoints are listed in the API endpoints document at https://www.sos.ca.gov/media
+CAL_COUNTY_URL = "https://api.sos.ca.gov/returns/{contest}/county/{county}"
+
+CAL_COUNTIES = [
+    "alameda", "alpine", "amador", "butte", "calaveras", "colusa", "contra-costa", "del-norte", "el-dorado", "fresno",
+    "glenn", "humboldt", "imperial", "inyo", "kern", "kings", "lake", "lassen", "los-angeles", "madera",
+    "marin", "mariposa", "mendocino", "merced", "modoc", "mono", "monterey", "napa", "nevada", "orange",
+    "placer", "plumas", "riverside", "sacramento", "san-benito", "san-bernardino", "san-diego", "san-francisco", "san-joaquin", "san-luis-obispo",
+    "san-mateo", "santa-barbara", "santa-clara", "santa-cruz", "shasta", "sierra", "siskiyou", "solano", "sonoma", "stanislaus",
+    "sutter", "tehama", "trinity", "tulare", "tuolumne", "ventura", "yolo", "yuba",
+]
+
+#Every Oregon county. Oregon numbers them in alphabetical order, Baker = 01 to Yamhill = 36, and those are the numbers
+#the county= parameter takes. They're only used for races that aren't in the bulk listing
+OREGON_COUNTY_NAMES = [
+    "Baker", "Benton", "Clackamas", "Clatsop", "Columbia", "Coos", "Crook", "Curry", "Deschutes", "Douglas",
+    "Gilliam", "Grant", "Harney", "Hood River", "Jackson", "Jefferson", "Josephine", "Klamath", "Lake", "Lane",
+    "Lincoln", "Linn", "Malheur", "Marion", "Morrow", "Multnomah", "Polk", "Sherman", "Tillamook", "Umatilla",
+    "Union", "Wallowa", "Wasco", "Washington", "Wheeler", "Yamhill",
+]
+#{"01": "Baker", ...}. If a bulk listing has loaded, its county numbers are used over these (see oregon_index.county_codes)
+OREGON_COUNTIES = {f"{number:02d}": name for number, name in enumerate(OREGON_COUNTY_NAMES, 1)}
+
+#How many requests to have going at once, and how long the whole fan-out can take
+MAX_WORKERS = 16
+REQUEST_TIMEOUT = 15
+FANOUT_BUDGET = 60
+
+OUTPUT_DIR = "county_results"
+
+
+#Run fetch(key) for every key at the same time and return {key: result}
+#Anything that fails or isn't back before the budget runs out is left out, so one slow county can't hold up the run
+def fan_out(fetch, keys, budget=FANOUT_BUDGET):
+    results = {}
+    deadline = time.monotonic() + budget
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = {pool.submit(fetch, key): key for key in keys}
+    try:
+        for future in as_completed(futures, timeout=budget):
+            try:
+                results[futures[future]] = future.result()
+            except (requests.exceptions.RequestException, ValueError) as err:
+                print(f"Couldn't get county results for {futures[future]}: {err}")
+            if time.monotonic() > deadline:
+                break
+    except FanOutTimeout:
+        print(f"Ran out of time, {len(keys) - len(results)} counties left out")
+    #Don't wait for the ones that are still going
+    pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+#Turn long rows (one per county and candidate) into a choropleth table with one row per county
+#Everything is done on whole columns at once, so it's just as fast for 58 counties as for 5
+def county_table(rows):
+    df = pd.DataFrame(rows, columns=["County", "Candidate", "Votes"])
+    if df.empty:
+        return df
+    votes = df.pivot_table(index="County", columns="Candidate", values="Votes", aggfunc="sum", fill_value=0)
+    values = votes.to_numpy()
+    total = values.sum(axis=1)
+    #Sort each county's votes, so the last column is the leader and the one before it is second place
+    ordered = np.sort(values, axis=1)
+    first = ordered[:, -1]
+    second = ordered[:, -2] if values.shape[1] > 1 else np.zeros_like(first)
+    #Counties with no votes yet get 0% instead of dividing by zero
+    safe_total = np.where(total > 0, total, 1)
+
+    table = pd.DataFrame(index=votes.index)
+    for i, name in enumerate(votes.columns):
+        table[f"{name} Votes"] = values[:, i]
+    for i, name in enumerate(votes.columns):
+        table[f"{name} %"] = np.round(values[:, i] / safe_total * 100, 2)
+    table["Total Votes"] = total
+    table["Leader"] = np.where(total > 0, votes.columns.to_numpy()[values.argmax(axis=1)], "")
+    table["Margin"] = first - second
+    table["Margin %"] = np.round((first - second) / safe_total * 100, 2)
+    return table.reset_index()
+
+
+#California: request one contest for every county at the same time
+def california_rows(contest_endpoint, session):
+    def fetch(county):
+        r = http_cache.get(CAL_COUNTY_URL.format(contest=contest_endpoint, county=county), session=session, timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    rows = []
+    for county, data in fan_out(fetch, CAL_COUNTIES).items():
+        #The county pages look like the statewide ones: either one contest, or a list of them
+        contests = data if isinstance(data, list) else [data]
+        for row in normalize.cal_sos_rows(contests, None):
+            rows.append((county.replace("-", " ").title(), row["candidate"], row["votes"]))
+    return rows
+
+
+#Oregon: use the county rows from the bulk listing, or ask for each county if the race isn't in it
+def oregon_rows(race, session):
+    try:
+        indexed = oregon_index.load_index(race.get("category", "SW"), session)["by_id"].get(str(race["race_id"]))
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        indexed = None
+    if indexed is not None and indexed["county_rows"]:
+        #Keep only this primary's party, like the party= parameter does for the county-by-county requests
+        return [(oregon_index.county_of(row), row["calcCandidate"], row["calcCandidateVotes"] or 0)
+                for row in oregon_index.for_party(indexed["county_rows"], race.get("party", "0"))]
+
+    def fetch(county):
+        url = oregon_index.map_data_url(race.get("type", "SWPAR"), category=race.get("category", "SW"),
+                                        race_id=race["race_id"], party=race.get("party", "0"), county=county)
+        r = http_cache.get(url, session=session, timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    codes = dict(OREGON_COUNTIES, **oregon_index.county_codes())
+    rows = []
+    for county, data in fan_out(fetch, codes).items():
+        for row in data.get("d", []):
+            rows.append((codes[county], row["calcCandidate"], row["calcCandidateVotes"] or 0))
+    #A race can be on the ballot in only some counties, but say which ones are missing so a partial map doesn't go unnoticed
+    missing = sorted(set(OREGON_COUNTY_NAMES) - {county for county, candidate, votes in rows})
+    if missing:
+        print(f"{race['contest']} has no county results for {len(missing)} Oregon counties: {', '.join(missing)}")
+    return rows
+
+
+#Save one contest's county table. With a baseline (see baseline.py), each county's turnout compared with last time is added
+def save_table(state, contest, rows, baseline=None):
+    table = county_table(rows)
+    if baseline is not None and not table.empty:
+        before = table["County"].map(lambda county: baseline.county_total(STATE_SOURCES[state], contest, county)).astype(float)
+        table["Baseline Votes"] = before
+        table["Turnout vs Baseline %"] = np.round(table["Total Votes"] / before * 100, 1)
+    filename = f"{OUTPUT_DIR}/{state}_{contest.replace(' ', '_').replace('.', '').replace(',', '')}_county_results.csv"
+    table.to_csv(filename, index=False)
+    print(f"Saved {len(table)} counties for {contest} to {filename}")
+    return filename
+
+
+#Do every contest in county_races.json. The contests are also done at the same time, since most of the time is waiting on the network
+def run(config_file="county_races.json", baseline=None):
+    with open(config_file) as f:
+        config = json.load(f)
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    s = requests.Session()
+    #Allow enough connections for all the requests going at once
+    adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+    s.mount("https://", adapter)
+
+    started = time.monotonic()
+    jobs = [("California", race["contest"], lambda race=race: california_rows(race["endpoint"], s))
+            for race in config.get("california", [])]
+    jobs += [("Oregon", race["contest"], lambda race=race: oregon_rows(race, s))
+             for race in config.get("oregon", [])]
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        futures = {pool.submit(job): (state, contest) for state, contest, job in jobs}
+        for future in as_completed(futures):
+            state, contest = futures[future]
+            try:
+                save_table(state, contest, future.result(), baseline)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as err:
+                print(f"Couldn't get county results for {contest}: {err}")
+    print(f"County results done in {time.monotonic() - started:.1f} seconds")
+
+
+if __name__ == "__main__":
+    run()
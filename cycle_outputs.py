@@ -0,0 +1,38 @@
+# The steps at the end of a calprimary.py run that need every contest: the static results pages, the race projections,
+# the baseline comparison, the Parquet dataset, the results database and the results bundle.
+# An unsharded run does them itself. In a sharded run, each shard only has its own contests (after its own validation gate),
+# so each one puts its rows in its report, and shard.py merge does these steps once with every shard's rows.
+# Usage:
+#   cycle_outputs.save(cycle_rows, changed_contests, "2026-ca-primary", baseline_lookup, cycle)
+# Licensed under a GNU General Public License v3.0
+
+
+#rows are the run's rows that passed the gate, and changed is the (source, contest) keys that changed since the last run
+#cycle is the run's scheduler (see scheduler.py), so optional steps can be skipped to make the deadline
+def save(rows, changed, election, baseline_lookup=None, cycle=None):
+    #Rebuild the static results pages (results_site/) for the contests that changed, as a fallback for Datawrapper. See static_site.py
+    import static_site
+    static_site.build(rows)
+
+    #Work out the margins, the estimated outstanding ballots, and whether each race can still flip
+    if cycle is None or cycle.has_time("race projections", 5):
+        import projections
+        projections.save_summary(rows)
+
+    #Compare every candidate and party with the baseline election: swing, and turnout so far compared with last time
+    if baseline_lookup is not None:
+        baseline_lookup.save_comparison(rows)
+
+    #Add this cycle's results to the Parquet dataset, so they can all be loaded at once after the election. See results_dataset.py
+    #Only the contests that changed since the last run are added, so a count that didn't change isn't saved again
+    import results_dataset
+    changed_rows = [row for row in rows if (row["source"], row["contest"]) in changed]
+    results_dataset.write_cycle(changed_rows)
+
+    #And to the results database, so we can see how each contest changed through the night. See results_db.py
+    import results_db
+    results_db.save_cycle(changed_rows, election)
+
+    #And to the election's results bundle, which is what gets committed instead of the chart CSVs. See results_bundle.py
+    import results_bundle
+    results_bundle.write(rows, election)
@@ -0,0 +1,100 @@
+# Works out what changed since the last cycle, so the later steps (publishing charts, the live feed, alerts)
+# only have to deal with the contests that actually changed.
+# Each contest's rows are boiled down to a fingerprint. Contests with the same fingerprint as last cycle are skipped
+# right away, so only the changed contests are compared candidate by candidate.
+# The events are:
+#   votes_added        - a candidate's vote total changed ("added" can be negative if a county corrects a count)
+#   new_candidate      - a candidate showed up who wasn't in the contest last cycle (e.g. a write-in)
+#   leader_changed     - the first-place candidate changed
+#   reporting_advanced - the percent of precincts reporting went up by at least REPORTING_JUMP
+# The live feed keeps the last cycle in memory. The one-shot scrapers save it to STATE_FILE between runs.
+# Usage:
+#   previous = diff.load_state()
+#   events, changed, current = diff.compare(previous, cycle_rows)
+#   ...only publish the contests in changed...
+#   diff.save_state({**previous, **current})
+# Licensed under a GNU General Public License v3.0
+
+import hashlib, json, os
+
+import normalize
+
+STATE_FILE = "last_cycle.json"
+
+#How much the percent reporting has to go up before we send a "reporting_advanced" event
+REPORTING_JUMP = 1.0
+
+
+#A short string that changes whenever any candidate's votes, or the reporting, change
+def fingerprint(contest_rows):
+    counted = json.dumps([[row["candidate"], row["votes"]] for row in contest_rows] + [contest_rows[0]["reporting"]])
+    return hashlib.sha1(counted.encode("utf-8")).hexdigest()
+
+
+#Boil one contest's rows down to what the events are based on
+def contest_state(contest_rows, new_fingerprint=None):
+    ranked = sorted(contest_rows, key=lambda row: row["votes"], reverse=True)
+    return {
+        "fingerprint": new_fingerprint or fingerprint(contest_rows),
+        "votes": {row["candidate"]: row["votes"] for row in contest_rows},
+        "leader": ranked[0]["candidate"] if ranked[0]["votes"] > 0 else None,
+        "reporting": contest_rows[0]["reporting"],
+    }
+
+
+#The events for one contest that changed
+def contest_events(source, contest, old, new):
+    events = []
+    for candidate, votes in new["votes"].items():
+        if candidate not in old["votes"]:
+            events.append({"type": "new_candidate", "source": source, "contest": contest,
+                           "candidate": candidate, "votes": votes})
+        elif votes != old["votes"][candidate]:
+            events.append({"type": "votes_added", "source": source, "contest": contest, "candidate": candidate,
+                           "added": votes - old["votes"][candidate], "votes": votes})
+    if new["leader"] != old["leader"]:
+        events.append({"type": "leader_changed", "source": source, "contest": contest,
+                       "previous": old["leader"], "leader": new["leader"]})
+    if new["reporting"] is not None and old["reporting"] is not None \
+            and new["reporting"] - old["reporting"] >= REPORTING_JUMP:
+        events.append({"type": "reporting_advanced", "source": source, "contest": contest,
+                       "previous": old["reporting"], "reporting": new["reporting"]})
+    return events
+
+
+#Compare the new rows with the previous cycle's states
+#previous is {(source, contest): state}, or an empty dict on the first cycle
+#Returns (events, the (source, contest) keys that changed, {(source, contest): state} for every contest in rows)
+#A contest we haven't seen before counts as changed, but has no events because there's nothing to compare it to
+def compare(previous, rows):
+    events = []
+    changed = []
+    current = {}
+    for key, contest_rows in normalize.by_contest(rows).items():
+        new_fingerprint = fingerprint(contest_rows)
+        old = previous.get(key)
+        #Same as last cycle, keep the old state and move on
+        if old is not None and old["fingerprint"] == new_fingerprint:
+            current[key] = old
+            continue
+        current[key] = contest_state(contest_rows, new_fingerprint)
+        changed.append(key)
+        if old is not None:
+            events += contest_events(key[0], key[1], old, current[key])
+    return events, changed, current
+
+
+#Load the states saved by the last run, or an empty dict if there wasn't one
+def load_state(filename=STATE_FILE):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        saved = json.load(f)
+    return {(entry["source"], entry["contest"]): entry["state"] for entry in saved}
+
+
+def save_state(states, filename=STATE_FILE):
+    saved = [{"source": source, "contest": contest, "state": state} for (source, contest), state in states.items()]
+    with open(filename + ".tmp", "w") as f:
+        json.dump(saved, f)
+    os.replace(filename + ".tmp", filename)
@@ -0,0 +1,123 @@
+# Tracks how fresh the published charts really are. The "Last updated" note on each chart says when the scraper ran,
+# not when the results changed, so for every contest that changes we record five times:
+#   upstream  - when the source says the results changed (the CA SOS ReportingTime, or Clarity's Last-Modified header),
+#               if it says
+#   seen      - when we fetched the results that had the change
+#   parsed    - when they were turned into rows (normalize.py)
+#   written   - when the contest's CSV was written
+#   published - when the contest's chart was republished on Datawrapper
+# Each run adds one line per changed contest to freshness_log.csv, and rebuilds freshness_histograms.csv,
+# which counts how long each step took, for each source and each contest, in buckets (up to 1 second, up to 5, ...).
+# Usage:
+#   tracker = freshness.Tracker()
+#   tracker.mark(changed, "seen", fetched)   # changed is the (source, contest) keys diff.py says changed
+#   ...
+#   tracker.save()                           # at the end of the run
+# Licensed under a GNU General Public License v3.0
+
+import csv, datetime, os, time, numpy as np, pandas as pd
+
+LOG_FILE = "freshness_log.csv"
+HISTOGRAM_FILE = "freshness_histograms.csv"
+
+STAGES = ["upstream", "seen", "parsed", "written", "published"]
+
+#The steps the histograms are made for: (name, from, to)
+STEPS = [
+    ("detect", "upstream", "seen"),
+    ("parse", "seen", "parsed"),
+    ("write", "parsed", "written"),
+    ("publish", "written", "published"),
+    ("total", "seen", "published"),
+    ("end to end", "upstream", "published"),
+]
+
+#Upper ends of the histogram buckets, in seconds. Anything longer goes in the last bucket
+BUCKETS = [1, 5, 15, 30, 60, 120, 300, 600]
+
+
+class Tracker:
+    def __init__(self):
+        #{(source, contest): {stage: unix time}}
+        self.stamps = {}
+
+    #Record that the contests got to a stage. Only the first time counts, so a contest that's written twice keeps the earlier time
+    def mark(self, keys, stage, when=None):
+        when = time.time() if when is None else when
+        for key in keys:
+            self.stamps.setdefault(tuple(key), {}).setdefault(stage, when)
+
+    #Record when the source says each contest changed, from {contest: unix time or None}, for the keys that changed
+    def mark_upstream(self, keys, times):
+        for key in keys:
+            if times.get(key[1]) is not None:
+                self.mark([key], "upstream", times[key[1]])
+
+    #Add this run's contests to the log and rebuild the histograms (unless histogram_file is None)
+    def save(self, log_file=LOG_FILE, histogram_file=HISTOGRAM_FILE):
+        if not self.stamps:
+            return
+        upgrade_log(log_file)
+        new_file = not os.path.isfile(log_file)
+        with open(log_file, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["Source", "Contest"] + [stage.title() for stage in STAGES])
+            for (source, contest), stamps in self.stamps.items():
+                writer.writerow([source, contest] + [_iso(stamps.get(stage)) for stage in STAGES])
+        self.stamps = {}
+        if histogram_file is not None:
+            save_histograms(log_file, histogram_file)
+
+
+#Logs from before the upstream time was recorded get an empty Upstream column, so new lines line up with the header
+def upgrade_log(log_file=LOG_FILE):
+    if not os.path.isfile(log_file):
+        return
+    with open(log_file, newline="") as f:
+        header = next(csv.reader(f), [])
+    if "Upstream" in header or not header:
+        return
+    df = pd.read_csv(log_file, dtype=str)
+    df.insert(2, "Upstream", "")
+    df.to_csv(log_file, index=False)
+
+
+def _iso(stamp):
+    if stamp is None:
+        return ""
+    return datetime.datetime.fromtimestamp(stamp, datetime.timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _bucket_labels():
+    return [f"<={upper}s" for upper in BUCKETS] + [f">{BUCKETS[-1]}s"]
+
+
+#Count how long each step took in each bucket, with the median and 90th percentile, for every group in df
+def _histograms(df, group_columns):
+    labels = _bucket_labels()
+    rows = []
+    for step, start, end in STEPS:
+        seconds = (df[end.title()] - df[start.title()]).dt.total_seconds()
+        step_df = df[group_columns].assign(seconds=seconds).dropna(subset=["seconds"])
+        for group, group_df in step_df.groupby(group_columns, sort=True):
+            values = group_df["seconds"].to_numpy()
+            counts = np.bincount(np.searchsorted(BUCKETS, values, side="left"), minlength=len(labels))
+            group = group if isinstance(group, tuple) else (group,)
+            rows.append(list(group) + [step, len(values), round(float(np.median(values)), 3),
+                                       round(float(np.percentile(values, 90)), 3)] + counts.tolist())
+    return pd.DataFrame(rows, columns=group_columns + ["Step", "Count", "Median Seconds", "P90 Seconds"] + labels)
+
+
+#Rebuild the histograms from the whole log: one set per source, then one per contest
+def save_histograms(log_file=LOG_FILE, histogram_file=HISTOGRAM_FILE):
+    upgrade_log(log_file)
+    df = pd.read_csv(log_file)
+    for stage in STAGES:
+        df[stage.title()] = pd.to_datetime(df[stage.title()], utc=True, format="ISO8601")
+    by_source = _histograms(df, ["Source"]).assign(Contest="(all)")
+    by_contest = _histograms(df, ["Source", "Contest"])
+    histograms = pd.concat([by_source, by_contest], ignore_index=True)
+    histograms = histograms[["Source", "Contest"] + [column for column in histograms.columns if column not in ("Source", "Contest")]]
+    histograms.to_csv(histogram_file, index=False)
+    return histograms
@@ -0,0 +1,338 @@
+# A response cache on disk, shared by all the scrapers.
+# - Things that don't change during the night (Clarity election settings, etc.) are kept for hours, so after the first run they cost nothing.
+# - Once those go stale, the old copy is still used right away while a fresh one is fetched in the background.
+# - Live results are always fetched, but if the request fails, the last good copy (up to 15 minutes old) is used instead,
+#   so a timeout at the wrong moment doesn't blank a chart.
+# - Requests to the hosts that sometimes stall (HEDGE_HOSTS) are hedged: if one takes longer than 95% of that host's recent
+#   requests, a second copy is sent and whichever answers first is used. Only a few percent of requests can be hedged.
+# - When running the scrapers cell by cell in VS Code/Jupyter, set the NOTEBOOK_CACHE environment variable to a number of
+#   seconds (or call http_cache.interactive(300) in a cell), and re-running a cell reuses the response it got last time
+#   (and the JSON parsed from it) if it's newer than that, straight from memory, so working on a chart cell doesn't keep
+#   hitting the SOS servers.
+# Usage: r = http_cache.get(url)  # works like requests.get, r.json(), r.raise_for_status() etc.
+# Set the HTTP_CACHE environment variable to 0 to turn the cache off.
+# Licensed under a GNU General Public License v3.0
+
+import atexit, collections, hashlib, json, os, re, tempfile, threading, time, requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlparse
+
+CACHE_DIR = "http_cache"
+ENABLED = os.environ.get("HTTP_CACHE", "1") != "0"
+
+#How long a cached copy is fresh (ttl), how much longer it can be used while a new one is fetched in the background (revalidate),
+#and how old a copy can be used if the upstream request fails (stale_if_error). All in seconds.
+#The first class that matches the URL is used
+#NOTE: Add new endpoint classes here if we start requesting something new
+ENDPOINT_CLASSES = [
+    #Clarity election settings and listings don't change during the night
+    ("static", re.compile(r"clarityelections\.com/.*/(elections|electionsettings|settings|en/electionsettings)\.json"),
+     {"ttl": 12 * 3600, "revalidate": 24 * 3600, "stale_if_error": 48 * 3600}),
+    #Clarity's current version number changes every time new results are posted, so it's checked on every request
+    #(an If-None-Match request, so it's cheap when it hasn't changed). An old one would point at old results
+    ("version", re.compile(r"clarityelections\.com/.*/current_ver\.txt"),
+     {"ttl": 0, "revalidate": 0, "stale_if_error": 15 * 60}),
+    #Everything else is live results
+    ("live", re.compile(r""),
+     {"ttl": 0, "revalidate": 0, "stale_if_error": 15 * 60}),
+]
+
+#Hosts whose requests are hedged. Most of their responses are fast, but every so often one stalls for tens of seconds
+#NOTE: Add a host here if it starts stalling too
+HEDGE_HOSTS = {"orresultswebservices.azureedge.us", "api.sos.ca.gov"}
+
+#At most this share of requests (plus one per run) can get a hedged copy, so the upstream doesn't see much extra traffic
+HEDGE_BUDGET = 0.05
+
+#How many recent request times are kept per host, and how many are needed before we start hedging
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+#The recent request times are saved here (in CACHE_DIR) at the end of each run, so the next run can hedge right away
+LATENCY_FILE = "latency.json"
+
+#Seconds a response is reused from memory when re-running notebook cells, 0 (the default) for never
+NOTEBOOK_CACHE = float(os.environ.get("NOTEBOOK_CACHE", "0"))
+
+#Background fetches for stale-while-revalidate. Python waits for them to finish before exiting
+_background = ThreadPoolExecutor(max_workers=4)
+_refreshing = set()
+_lock = threading.Lock()
+
+#The requests to HEDGE_HOSTS, and their hedged copies, run here
+_hedge_pool = ThreadPoolExecutor(max_workers=32)
+_latencies = {}
+_latencies_loaded = False
+_hedge_counts = {"requests": 0, "hedges": 0}
+
+#{url: (time it was fetched, response)} for NOTEBOOK_CACHE
+_memo = {}
+
+
+#A response that looks enough like requests.Response for the scrapers
+class CachedResponse:
+    def __init__(self, url, status_code, content, headers, fetched_at, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.fetched_at = fetched_at
+        self.from_cache = from_cache
+        self._parsed = None
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    #With NOTEBOOK_CACHE on, re-running a cell gets this same response back, so the parsed JSON is kept with it and the
+    #cell doesn't parse it again either. The scrapers only read what json() gives back, so it's safe to share
+    def json(self):
+        if NOTEBOOK_CACHE <= 0:
+            return json.loads(self.content)
+        if self._parsed is None:
+            self._parsed = json.loads(self.content)
+        return self._parsed
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+#Find the endpoint class for a URL, returns (name, settings)
+def classify(url):
+    for name, pattern, settings in ENDPOINT_CLASSES:
+        if pattern.search(url):
+            return name, settings
+
+
+def _paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json"), os.path.join(CACHE_DIR, f"{key}.body")
+
+
+def _load(url):
+    meta_path, body_path = _paths(url)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(body_path, "rb") as f:
+            body = f.read()
+    except (OSError, ValueError):
+        return None
+    return CachedResponse(url, meta["status_code"], body, meta["headers"], meta["fetched_at"], True)
+
+
+#Write to a temporary file of our own and then swap it in, so a reader never sees half a file
+#and other processes using the same cache (shards, the live feed) can't swap in ours
+def _replace(path, content):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _store(response):
+    meta_path, body_path = _paths(response.url)
+    meta = json.dumps({"url": response.url, "status_code": response.status_code, "headers": response.headers,
+                       "fetched_at": response.fetched_at}).encode("utf-8")
+    #A cache we couldn't write to is just a miss next time, it shouldn't fail the request
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _replace(body_path, response.content)
+        _replace(meta_path, meta)
+    except OSError as err:
+        print(f"Couldn't cache {response.url}: {err}")
+
+
+def _latency_path():
+    return os.path.join(CACHE_DIR, LATENCY_FILE)
+
+
+#Load the request times saved by the last run, the first time we need them
+def _load_latencies():
+    global _latencies_loaded
+    with _lock:
+        if _latencies_loaded:
+            return
+        _latencies_loaded = True
+        try:
+            with open(_latency_path()) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        for host, seconds in saved.items():
+            _latencies[host] = collections.deque(seconds, maxlen=LATENCY_SAMPLES)
+
+
+def save_latencies():
+    if not _latencies:
+        return
+    with _lock:
+        saved = {host: list(seconds) for host, seconds in _latencies.items()}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _replace(_latency_path(), json.dumps(saved).encode("utf-8"))
+    except OSError as err:
+        print(f"Couldn't save the request times: {err}")
+
+
+atexit.register(save_latencies)
+
+
+def record_latency(host, seconds):
+    with _lock:
+        _latencies.setdefault(host, collections.deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+
+#How long to wait before hedging a request to a host: the 95th percentile of its recent request times
+#None if we haven't seen enough requests to know
+def hedge_after(host):
+    with _lock:
+        seconds = sorted(_latencies.get(host, []))
+    if len(seconds) < MIN_LATENCY_SAMPLES:
+        return None
+    return seconds[int(len(seconds) * 0.95)]
+
+
+def _timed_get(get, host, url, headers, timeout):
+    started = time.monotonic()
+    r = get(url, headers=headers, timeout=timeout)
+    record_latency(host, time.monotonic() - started)
+    return r
+
+
+#requests.get, but for HEDGE_HOSTS, send a second copy of the request if the first is slower than usual,
+#and use whichever response comes back first
+def _hedged_get(url, headers, session, timeout):
+    get = (session or requests).get
+    host = urlparse(url).hostname
+    if host not in HEDGE_HOSTS:
+        return get(url, headers=headers, timeout=timeout)
+
+    _load_latencies()
+    delay = hedge_after(host)
+    with _lock:
+        _hedge_counts["requests"] += 1
+    primary = _hedge_pool.submit(_timed_get, get, host, url, headers, timeout)
+    if delay is None:
+        return primary.result()
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    with _lock:
+        allowed = _hedge_counts["hedges"] < HEDGE_BUDGET * _hedge_counts["requests"] + 1
+        if allowed:
+            _hedge_counts["hedges"] += 1
+    if not allowed:
+        return primary.result()
+    print(f"{host} is slower than usual (over {delay:.1f} seconds), sending a second request")
+    #The copy gets its own connection, in case the session's connection is the one that's stuck
+    hedge = _hedge_pool.submit(_timed_get, requests.get, host, url, headers, timeout)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    #Both failed, so raise the first request's error
+    return primary.result()
+
+
+#Make the real request. If we have a cached copy, ask the server whether it changed (ETag / Last-Modified)
+def _fetch(url, headers, session, timeout, cached):
+    request_headers = dict(headers or {})
+    if cached is not None:
+        if cached.headers.get("ETag"):
+            request_headers["If-None-Match"] = cached.headers["ETag"]
+        if cached.headers.get("Last-Modified"):
+            request_headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+    r = _hedged_get(url, request_headers, session, timeout)
+    now = time.time()
+    #Not modified, so the cached copy is good for another ttl
+    if r.status_code == 304 and cached is not None:
+        response = CachedResponse(url, cached.status_code, cached.content, cached.headers, now, False)
+    else:
+        r.raise_for_status()
+        kept_headers = {name: r.headers[name] for name in ("ETag", "Last-Modified", "Content-Type") if name in r.headers}
+        response = CachedResponse(url, r.status_code, r.content, kept_headers, now, False)
+    #Don't cache empty responses (Clarity sometimes sends those while it's updating)
+    if response.content:
+        _store(response)
+    return response
+
+
+def _refresh(url, headers, session, timeout, cached):
+    try:
+        _fetch(url, headers, session, timeout, cached)
+    except requests.exceptions.RequestException as err:
+        print(f"Background refresh of {url} failed: {err}")
+    finally:
+        with _lock:
+            _refreshing.discard(url)
+
+
+#Turn on the notebook cache from a cell: responses are reused from memory for this many seconds. 0 turns it off
+def interactive(seconds=300):
+    global NOTEBOOK_CACHE
+    NOTEBOOK_CACHE = seconds
+    _memo.clear()
+    print(f"Reusing responses for {seconds} seconds when cells are run again" if seconds else "Notebook cache is off")
+
+
+#Whether something fetched at a time.monotonic() time can still be reused by the notebook cache
+def notebook_fresh(fetched):
+    return NOTEBOOK_CACHE > 0 and time.monotonic() - fetched < NOTEBOOK_CACHE
+
+
+#Get a URL through the cache. Works like requests.get(url, headers=...)
+#endpoint_class can be given to override the class picked from the URL
+def get(url, headers=None, session=None, timeout=30, endpoint_class=None):
+    if url in _memo and notebook_fresh(_memo[url][0]):
+        print(f"Reusing the response for {url} from {time.monotonic() - _memo[url][0]:.0f} seconds ago (NOTEBOOK_CACHE)")
+        return _memo[url][1]
+    response = _get(url, headers, session, timeout, endpoint_class)
+    if NOTEBOOK_CACHE > 0:
+        _memo[url] = (time.monotonic(), response)
+    return response
+
+
+def _get(url, headers, session, timeout, endpoint_class):
+    if not ENABLED:
+        return (session or requests).get(url, headers=headers, timeout=timeout)
+
+    if endpoint_class is None:
+        settings = classify(url)[1]
+    else:
+        settings = next(settings for name, pattern, settings in ENDPOINT_CLASSES if name == endpoint_class)
+    cached = _load(url)
+    age = time.time() - cached.fetched_at if cached is not None else None
+
+    #Fresh enough, no request needed
+    if cached is not None and age < settings["ttl"]:
+        return cached
+
+    #A bit stale: use it now, and get a new copy in the background for next time
+    if cached is not None and age < settings["ttl"] + settings["revalidate"]:
+        with _lock:
+            start = url not in _refreshing
+            _refreshing.add(url)
+        if start:
+            _background.submit(_refresh, url, headers, session, timeout, cached)
+        return cached
+
+    try:
+        return _fetch(url, headers, session, timeout, cached)
+    except requests.exceptions.RequestException as err:
+        #The upstream failed. A recent copy is better than a blank chart
+        if cached is not None and age < settings["ttl"] + settings["stale_if_error"]:
+            print(f"Request for {url} failed ({err}), using the copy from {age / 60:.0f} minutes ago")
+            return cached
+        raise
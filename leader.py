@@ -0,0 +1,205 @@
+# Lets two or more copies of livefeed.py or calprimary.py run on different machines, so one machine going down on election
+# night doesn't stop the updates. They share a lease in a small SQLite file (on a shared drive). Only the copy holding the
+# lease, the leader, polls the sources and sends events or publishes the charts. The others wait on standby.
+# livefeed.py checks the lease every few seconds. calprimary.py runs once and stops, so "leader.py run" runs it on a schedule
+# on each machine: the leader runs it every few minutes and renews the lease while it runs and in between, and the standbys
+# check the lease every few seconds, so one of them takes over (and runs it straight away) within seconds of the leader stopping.
+# The leader renews the lease while it runs. If it stops renewing (it crashed, or lost its connection), the lease runs out
+# after TTL seconds and the next standby to check takes it over. It starts from the contest states the leader last saved
+# next to the lease (see diff.py), so it only sends what changed since then.
+# Each time the lease changes hands its term goes up by one, so the log shows every takeover.
+# The machines' clocks have to be roughly in sync (a second or two), since the lease runs out at a set time.
+# Usage:
+#   python livefeed.py --lease /mnt/shared/leader.db --node laptop-1   # on each machine
+#   python leader.py run --lease /mnt/shared/leader.db --node laptop-1 --every 300 -- python calprimary.py   # on each machine
+#   python leader.py status --lease /mnt/shared/leader.db              # who's leading (add --name calprimary for the scraper)
+# Licensed under a GNU General Public License v3.0
+
+import argparse, os, socket, sqlite3, subprocess, sys, time
+
+LEASE_FILE = "leader.db"
+
+#Seconds a lease lasts without being renewed. A standby takes over at most about TTL + TTL / 3 seconds after the leader stops
+DEFAULT_TTL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL,
+    term INTEGER NOT NULL
+);
+"""
+
+
+class Lease:
+    def __init__(self, filename=LEASE_FILE, node=None, ttl=DEFAULT_TTL, name="livefeed"):
+        self.filename = filename
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.name = name
+        self.term = None
+        self.expires = 0
+
+    def _connect(self):
+        #No WAL here, it doesn't work on network drives. BEGIN IMMEDIATE below locks the file while the lease is checked
+        db = sqlite3.connect(self.filename, timeout=self.ttl / 3, isolation_level=None)
+        db.executescript(SCHEMA)
+        return db
+
+    #Take the lease if it's free or has run out, or renew it if we already have it. Returns whether we're the leader
+    def acquire(self):
+        now = time.time()
+        try:
+            db = self._connect()
+        except sqlite3.OperationalError as err:
+            print(f"Couldn't open the lease: {err}")
+            return self.expires > now
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT holder, expires, term FROM lease WHERE name = ?", (self.name,)).fetchone()
+            if row is not None and row[0] != self.node and row[1] > now:
+                db.execute("COMMIT")
+                if self.term is not None:
+                    print(f"{self.node} lost the lease to {row[0]} (term {row[2]})")
+                self.term = None
+                return False
+            term = row[2] if row is not None and row[0] == self.node else (row[2] + 1 if row is not None else 1)
+            db.execute("INSERT OR REPLACE INTO lease (name, holder, expires, term) VALUES (?, ?, ?, ?)",
+                       (self.name, self.node, now + self.ttl, term))
+            db.execute("COMMIT")
+        except sqlite3.OperationalError as err:
+            #The file was locked for too long. Keep leading until our lease would run out anyway, then step down
+            print(f"Couldn't check the lease: {err}")
+            return self.expires > now
+        finally:
+            db.close()
+        if self.term != term:
+            print(f"{self.node} is now the leader (term {term})")
+        self.term = term
+        self.expires = now + self.ttl
+        return True
+
+    #Wait for the given number of seconds, renewing the lease as we go. Returns False as soon as the lease is lost
+    def hold(self, seconds):
+        until = time.monotonic() + seconds
+        while True:
+            left = until - time.monotonic()
+            if left <= 0:
+                return True
+            time.sleep(min(left, self.ttl / 3))
+            if not self.acquire():
+                return False
+
+    #Give up the lease, so a standby can take over straight away instead of waiting for it to run out
+    def release(self):
+        db = self._connect()
+        try:
+            with db:
+                #The row is kept, so the next leader's term still goes up
+                db.execute("UPDATE lease SET expires = 0 WHERE name = ? AND holder = ?", (self.name, self.node))
+        finally:
+            db.close()
+        self.term = None
+        self.expires = 0
+
+
+#A lease from --lease FILE, --node NAME, --lease-ttl SECONDS and --lease-name NAME on the command line (run() passes
+#these to the script it runs), or None if there's no --lease. The options are taken out of sys.argv, like shard.from_argv
+def from_argv(name, ttl=DEFAULT_TTL):
+    values = {}
+    for option in ("--lease", "--node", "--lease-ttl", "--lease-name"):
+        if option in sys.argv:
+            position = sys.argv.index(option)
+            values[option] = sys.argv[position + 1]
+            del sys.argv[position:position + 2]
+    if "--lease" not in values:
+        return None
+    return Lease(values["--lease"], node=values.get("--node"), ttl=float(values.get("--lease-ttl", ttl)),
+                 name=values.get("--lease-name", name))
+
+
+#Run a script that runs once and stops (like calprimary.py) every `every` seconds, but only while we hold the lease.
+#The lease is renewed every TTL / 3 seconds while the script runs and while we wait for the next run, and the script is
+#given the lease options so it can check it too (see from_argv). If the lease is lost during a run, the script is stopped,
+#since a standby has already taken over. A standby checks the lease every TTL / 3 seconds, and runs the script as soon as it gets it
+def run(command, lease, every):
+    command = command + ["--lease", lease.filename, "--node", lease.node, "--lease-ttl", str(lease.ttl), "--lease-name", lease.name]
+    leading = False
+    try:
+        while True:
+            if not lease.acquire():
+                leading = False
+                time.sleep(lease.ttl / 3)
+                continue
+            leading = True
+            started = time.monotonic()
+            child = subprocess.Popen(command)
+            while leading:
+                try:
+                    child.wait(timeout=lease.ttl / 3)
+                    break
+                except subprocess.TimeoutExpired:
+                    leading = lease.acquire()
+            if not leading:
+                print(f"Lost the lease, stopping {' '.join(command[:2])}")
+                child.terminate()
+                child.wait()
+            else:
+                if child.returncode:
+                    print(f"The run failed with exit code {child.returncode}")
+                leading = lease.hold(max(0, every - (time.monotonic() - started)))
+            if not leading:
+                print("Going back to standby")
+    finally:
+        #Let a standby take over straight away
+        if leading:
+            lease.release()
+
+
+#Who holds the lease, as (holder, seconds until it runs out, term), or None if nobody does
+def status(filename=LEASE_FILE, name="livefeed"):
+    if not os.path.isfile(filename):
+        return None
+    db = sqlite3.connect(filename)
+    try:
+        row = db.execute("SELECT holder, expires, term FROM lease WHERE name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        db.close()
+    if row is None:
+        return None
+    return row[0], row[1] - time.time(), row[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show who holds a lease, or run a script on a schedule while holding one")
+    parser.add_argument("command", choices=["status", "run"])
+    parser.add_argument("--lease", default=LEASE_FILE, help="The lease file")
+    parser.add_argument("--name", help="Which lease: livefeed or calprimary (calprimary_shard_<i>_of_<N> for a shard). "
+                                       "The default is livefeed for status, and calprimary for run")
+    parser.add_argument("--node", help="For run: this machine's name in the lease, the default is the hostname and process ID")
+    parser.add_argument("--lease-ttl", type=float, default=DEFAULT_TTL, help="For run: seconds before a standby takes over")
+    parser.add_argument("--every", type=float, default=300, help="For run: seconds between the starts of the runs")
+    #For run, the command to run comes after --
+    argv, script = sys.argv[1:], []
+    if "--" in argv:
+        argv, script = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if not script:
+            parser.error("run needs a command, e.g. -- python calprimary.py")
+        run(script, Lease(args.lease, node=args.node, ttl=args.lease_ttl, name=args.name or "calprimary"), args.every)
+        return
+    current = status(args.lease, args.name or "livefeed")
+    if current is None:
+        print("Nobody holds the lease")
+    elif current[1] < 0:
+        print(f"{current[0]} held the lease (term {current[2]}), but it ran out {-current[1]:.1f} seconds ago")
+    else:
+        print(f"{current[0]} is the leader (term {current[2]}), the lease has {current[1]:.1f} seconds left")
+
+
+if __name__ == "__main__":
+    main()
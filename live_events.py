@@ -0,0 +1,85 @@
+# Pushes result changes to internal dashboards (live blog, alert bot) as Server-Sent Events.
+# Each cycle, the new normalized rows are compared with the previous cycle's in memory by diff.py,
+# and its change events are sent on to every subscriber.
+# Subscribers connect to http://<host>:<port>/events and get one "data: {...}" message per event.
+# Licensed under a GNU General Public License v3.0
+
+import json, queue, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Hands each event to every subscriber without ever blocking the scraper.
+#Every subscriber gets its own small queue. If a slow subscriber's queue fills up, its oldest event is dropped.
+class EventBroadcaster:
+    def __init__(self, max_queue=500):
+        self.max_queue = max_queue
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, events):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for event in events:
+            message = json.dumps(event)
+            for q in subscribers:
+                try:
+                    q.put_nowait(message)
+                except queue.Full:
+                    #Make room by dropping the oldest event for this subscriber
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+                    try:
+                        q.put_nowait(message)
+                    except queue.Full:
+                        pass
+
+
+#Start the SSE server in a background thread, so the scrape loop never waits on it
+#Each connection is handled on its own thread by ThreadingHTTPServer
+def serve_events(broadcaster, port=8765, host="0.0.0.0"):
+    class EventHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/events":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            q = broadcaster.subscribe()
+            try:
+                while True:
+                    try:
+                        message = q.get(timeout=15)
+                        self.wfile.write(f"data: {message}\n\n".encode("utf-8"))
+                    except queue.Empty:
+                        #A comment line keeps the connection open through proxies
+                        self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                broadcaster.unsubscribe(q)
+
+        #Don't print a line for every request
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), EventHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Streaming result changes at http://{host}:{port}/events")
+    return server
@@ -0,0 +1,91 @@
+# A long-running loop for election night that streams result changes to internal dashboards.
+# It polls the same sources as calprimary.py, normalizes the results, and pushes an event for every contest that changed.
+# Usage: python livefeed.py --port 8765 --interval 60 [--profile] [--lease leader.db --node laptop-1]
+#   --lease runs it as one of several copies on different machines, and only the leader polls and sends events. See leader.py
+# Licensed under a GNU General Public License v3.0
+
+import argparse, datetime, os, time, pytz, requests
+
+import clarity, diff, leader, live_events, normalize, pipeline, profiling
+
+#Set the timezone
+pacific_tz = pytz.timezone('US/Pacific')
+
+parser = argparse.ArgumentParser(description="Stream election result changes as Server-Sent Events")
+parser.add_argument("--port", type=int, default=8765, help="Port for the /events endpoint")
+parser.add_argument("--interval", type=int, default=60, help="Seconds between polls")
+parser.add_argument("--profile", action="store_true", help="Save a profile of the first cycle to profiles/. See profiling.py")
+parser.add_argument("--lease", help="A lease file shared with the other copies (e.g. on a shared drive). See leader.py")
+parser.add_argument("--node", help="This copy's name in the lease, the default is the hostname and process ID")
+parser.add_argument("--lease-ttl", type=float, default=leader.DEFAULT_TTL, help="Seconds before a standby takes over from a leader that stopped")
+args = parser.parse_args()
+
+#The same Clarity counties and watched contests as calprimary.py. See clarity.py
+counties = clarity.load_counties()
+
+broadcaster = live_events.EventBroadcaster()
+live_events.serve_events(broadcaster, port=args.port)
+
+s = requests.Session()
+previous = {}
+
+#With a lease, the leader saves the contest states next to it after every poll, so a standby that takes over picks up from there
+lease = None
+if args.lease:
+    lease = leader.Lease(args.lease, node=args.node, ttl=args.lease_ttl)
+    state_file = os.path.join(os.path.dirname(os.path.abspath(args.lease)), "livefeed_state.json")
+leading = False
+
+if args.profile:
+    profiling.start("livefeed")
+
+
+try:
+    while True:
+        if lease is not None and not lease.acquire():
+            if leading:
+                print("Going back to standby")
+            leading = False
+            time.sleep(lease.ttl / 3)
+            continue
+        if lease is not None and not leading:
+            previous = diff.load_state(state_file)
+            print(f"Starting from the last saved state of {len(previous)} contests")
+        leading = True
+
+        started = time.monotonic()
+        fetched_at = datetime.datetime.now(tz=pacific_tz).isoformat()
+        rows = []
+        #A failure in one source shouldn't stop the others from updating. A bad or cut-off response (ValueError from the JSON,
+        #or KeyError/TypeError from the normalizers) only skips that source this poll, so it doesn't stop the feed
+        try:
+            rows += normalize.cal_sos_rows(pipeline.fetch_statewide(s), fetched_at)
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as err:
+            print("Couldn't get the statewide results:", err)
+        for county in counties:
+            try:
+                rows += normalize.clarity_rows(clarity.fetch(county, s), fetched_at, county["county"], county["watched_contests"])
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as err:
+                print(f"Couldn't get the {county['county']} County results:", err)
+
+        events, changed, current = diff.compare(previous, rows)
+        #If this copy stalled for longer than the lease, a standby may have taken over and sent these already
+        if lease is not None and not lease.acquire():
+            continue
+        #Keep the old summary for any contest we couldn't fetch this time
+        previous.update(current)
+        broadcaster.publish(events)
+        print(f"{fetched_at}: {len(changed)} contests changed, {len(events)} events sent to {len(broadcaster.subscribers)} subscribers")
+        #Only the first cycle is profiled, this does nothing after that
+        profiling.stop()
+
+        #Wait for the next poll. The leader saves where it got to first, and renews the lease while it waits
+        if lease is None:
+            time.sleep(max(0, args.interval - (time.monotonic() - started)))
+        else:
+            diff.save_state(previous, state_file)
+            lease.hold(max(0, args.interval - (time.monotonic() - started)))
+finally:
+    #Let a standby take over straight away
+    if lease is not None and leading:
+        lease.release()
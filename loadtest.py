@@ -0,0 +1,246 @@
+# A load test for the pipeline. It makes up Oregon, California SOS and Clarity results at whatever size we want,
+# serves them from a local stand-in server, and runs them through the real scraper code end to end:
+# fetch -> normalize -> write CSVs -> projections -> publish (to a fake Datawrapper).
+# The California SOS and Clarity results go through streaming.run_cycle and clarity.fetch, like calprimary.py, so fetching,
+# writing and publishing overlap the same way they do on the night. The step times are added up across the threads.
+# Usage: python loadtest.py --scales 1,2,5,10
+# Scale 1 is about our normal load (50 contests, 10 charts). Scale 10 is 500 contests and 100 charts.
+# The report shows how long each step took, the peak memory, and whether a cycle still fits in the workflow's 5 minutes.
+# Licensed under a GNU General Public License v3.0
+
+import argparse, contextlib, io, json, os, random, shutil, tempfile, threading, time, tracemalloc, requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import clarity, http_cache, normalize, oregon_index, pipeline, projections, streaming, validate
+from replay import FakeDatawrapper
+
+#The workflow's timeout-minutes, in seconds
+CYCLE_BUDGET = 300
+
+#What scale 1 looks like
+BASE_CONTESTS = 50
+BASE_CHARTS = 10
+
+OREGON_COUNTIES = ["Baker", "Benton", "Clackamas", "Clatsop", "Columbia", "Coos", "Crook", "Curry", "Deschutes", "Douglas",
+                   "Gilliam", "Grant", "Harney", "Hood River", "Jackson", "Jefferson", "Josephine", "Klamath", "Lake", "Lane",
+                   "Lincoln", "Linn", "Malheur", "Marion", "Morrow", "Multnomah", "Polk", "Sherman", "Tillamook", "Umatilla",
+                   "Union", "Wallowa", "Wasco", "Washington", "Wheeler", "Yamhill"]
+
+
+#Made-up California SOS "returns/query" response
+def fake_cal_sos(contests, candidates, rng):
+    data = []
+    for c in range(contests):
+        votes = [rng.randint(0, 2_000_000) for _ in range(candidates)]
+        total = sum(votes) or 1
+        data.append({
+            "raceTitle": f"State Assembly District {c + 1} - Districtwide Results",
+            "Reporting": f"{rng.randint(0, 100)}% ({rng.randint(0, 500):,} of 500) precincts reporting",
+            "ReportingTime": "November 3, 2026, 9:00 p.m.",
+            "candidates": [{"Name": f"Candidate {c}-{i}", "Party": rng.choice(list(normalize.CAL_PARTIES)),
+                            "Votes": f"{v:,}", "Percent": f"{v / total * 100:.1f}", "incumbent": i == 0}
+                           for i, v in enumerate(votes)],
+        })
+    return data
+
+
+#Made-up Clarity summary.json
+def fake_clarity(contests, candidates, rng):
+    data = []
+    for c in range(contests):
+        votes = [rng.randint(0, 50_000) for _ in range(candidates)]
+        total = sum(votes) or 1
+        data.append({"C": f"County Contest {c + 1}", "TP": 68, "PR": rng.randint(0, 68),
+                     "CH": [f"CANDIDATE {c}-{i}" for i in range(candidates)], "P": [""] * candidates,
+                     "V": votes, "PCT": [v / total * 100 for v in votes]})
+    return data
+
+
+#Made-up Oregon bulk CTYALL listing, with one row per candidate per county
+#Each candidate keeps the same party in every county, like the real listing, so the counties add back up to one row each
+def fake_oregon(contests, candidates, counties, rng):
+    rows = []
+    for c in range(contests):
+        parties = [rng.choice(["Democrat", "Republican"]) for _ in range(candidates)]
+        for county in OREGON_COUNTIES[:counties]:
+            for i in range(candidates):
+                rows.append({"RaceID": 300000000 + c, "RaceName": f"State Representative, {c + 1}th District",
+                             "calcCandidate": f"Candidate {c}-{i}", "PartyName": parties[i],
+                             "calcCandidateVotes": rng.randint(0, 20_000), "calcCandidatePercentage": 0.0,
+                             "CountyName": county})
+    return {"d": rows}
+
+
+#Serve the made-up responses from a local server, so the scrapers make real HTTP requests
+def serve(payloads):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = payloads.get(self.path.split("?")[0].strip("/"))
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+#Wrap a step so the time spent in it is added to timings[step], even when it runs in several threads at once
+def timed(timings, step, function):
+    lock = threading.Lock()
+
+    def run(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with lock:
+                timings[step] = timings.get(step, 0.0) + time.perf_counter() - started
+    return run
+
+
+#The first count contests' charts, named like the CSVs the source writes
+def fake_races(contests, csv_name, count, prefix):
+    names = list(dict.fromkeys(contests))[:count]
+    return [{"filename": csv_name(name), "Key": f"{prefix}{i}"} for i, name in enumerate(names)]
+
+
+#Run one cycle at one scale and return the report for it
+def run_scale(scale, candidates, counties, api_latency, seed=0):
+    rng = random.Random(seed)
+    contests = BASE_CONTESTS * scale
+    charts = BASE_CHARTS * scale
+    #Split the contests between the three sources
+    per_source = max(1, contests // 3)
+    cal_data = fake_cal_sos(per_source, candidates, rng)
+    clarity_data = fake_clarity(per_source, candidates, rng)
+    #A made-up Clarity county, served at the same paths as the real site
+    county = {"county": "Loadtest", "path": "CA/Loadtest", "election_id": "1", "watched_contests": None, "races": []}
+    payloads = {
+        "ca": json.dumps(cal_data).encode(),
+        "CA/Loadtest/1/current_ver.txt": b"1",
+        "CA/Loadtest/1/1/json/en/summary.json": json.dumps(clarity_data).encode(),
+        "oregon": json.dumps(fake_oregon(contests - 2 * per_source, candidates, counties, rng)).encode(),
+    }
+    server = serve(payloads)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    #Point the scraper code at the local server
+    pipeline.CAL_STATEWIDE_URL = f"{base}/ca"
+    clarity.BASE_URL = base
+    oregon_index.BASE_URL = f"{base}/oregon"
+    oregon_index._indexes.clear()
+
+    out_dir = tempfile.mkdtemp(prefix="loadtest_")
+    #Keep the made-up responses out of the real cache
+    cache_dir = http_cache.CACHE_DIR
+    http_cache.CACHE_DIR = os.path.join(out_dir, "http_cache")
+    timings = {}
+    s = requests.Session()
+    fetched_at = "2026-11-03T21:00:00-08:00"
+    csv_name = clarity.csv_namer(county)
+    #Half the charts are statewide and half are for the county
+    cal_races = fake_races([row["contest"] for row in normalize.cal_sos_rows(cal_data, None)],
+                           pipeline.statewide_csv_name, charts // 2, "statewide")
+    county_races = fake_races([row["contest"] for row in normalize.clarity_rows(clarity_data, None, county["county"])],
+                              csv_name, charts - len(cal_races), "county")
+    #The same sources as calprimary.py, with each step timed
+    sources = [
+        {"name": "statewide",
+         "fetch": timed(timings, "fetch", lambda: pipeline.fetch_statewide(s)),
+         "rows": timed(timings, "normalize", lambda data: normalize.cal_sos_rows(data, fetched_at)),
+         "write": timed(timings, "write", lambda rows: pipeline.write_statewide_csvs(rows, out_dir)),
+         "csv_name": pipeline.statewide_csv_name,
+         "races": cal_races},
+        {"name": "Loadtest County",
+         "fetch": timed(timings, "fetch", lambda: clarity.fetch(county, s)),
+         "rows": timed(timings, "normalize", lambda data: normalize.clarity_rows(data, fetched_at, county["county"])),
+         "write": timed(timings, "write", lambda rows: pipeline.write_shasta_csvs(rows, out_dir, csv_name)),
+         "csv_name": csv_name,
+         "races": county_races,
+         "check": lambda data: validate.clarity_problems(data, clarity.source_name(county))},
+    ]
+    dw = FakeDatawrapper(latency=api_latency)
+    publish_charts = pipeline.publish_charts
+    pipeline.publish_charts = timed(timings, "publish", publish_charts)
+    tracemalloc.start()
+    cycle_started = time.perf_counter()
+    try:
+        result = streaming.run_cycle(sources, dw, {}, "11/03/2026, 09:00 PM", out_dir=out_dir,
+                                     gate=validate.Gate(os.path.join(out_dir, validate.HOLDS_FILE)))
+        timings["streamed cycle"] = time.perf_counter() - cycle_started
+
+        #The Oregon scrapers still fetch their races one after another
+        started = time.perf_counter()
+        index = oregon_index.load_index("SW", s)
+        oregon = [oregon_index.get_race(race_id, session=s) for race_id in index["by_id"]]
+        timings["fetch"] = timings.get("fetch", 0.0) + time.perf_counter() - started
+        started = time.perf_counter()
+        oregon_rows = [row for data in oregon for row in normalize.oregon_rows(data, fetched_at)]
+        timings["normalize"] = timings.get("normalize", 0.0) + time.perf_counter() - started
+
+        started = time.perf_counter()
+        projections.summarize(result["rows"] + oregon_rows)
+        timings["projections"] = time.perf_counter() - started
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pipeline.publish_charts = publish_charts
+        server.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+        #The local server's request times aren't real ones, so don't save them to the real cache when we exit
+        http_cache._latencies.clear()
+        http_cache.CACHE_DIR = cache_dir
+
+    if result["errors"]:
+        raise RuntimeError(f"The cycle failed: {result['errors']}")
+    total_rows = len(result["rows"]) + len(oregon_rows)
+    cycle = time.perf_counter() - cycle_started
+    return {"scale": scale, "contests": contests, "charts": len(dw.calls) // 3, "rows": total_rows,
+            "cycle": cycle, "rows_per_sec": total_rows / cycle, "peak_mb": peak / 1e6, **timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the pipeline with made-up results")
+    parser.add_argument("--scales", default="1,2,5,10", help="Comma-separated list of scales to run")
+    parser.add_argument("--candidates", type=int, default=8, help="Candidates per contest")
+    parser.add_argument("--counties", type=int, default=36, help="Counties per Oregon contest")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Seconds each fake Datawrapper call takes. The real API is about 0.3-1 second per call")
+    args = parser.parse_args()
+
+    #The scraper code prints a line for every file, which would drown out the report
+    reports = []
+    for scale in [int(x) for x in args.scales.split(",")]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            reports.append(run_scale(scale, args.candidates, args.counties, args.api_latency))
+        print(f"Scale {scale} done")
+
+    steps = ["fetch", "normalize", "write", "projections", "publish", "streamed cycle"]
+    print()
+    print(f"{'scale':>5} {'contests':>8} {'charts':>6} {'rows':>8} " + " ".join(f"{step:>11}" for step in steps) +
+          f" {'cycle':>8} {'rows/s':>9} {'peak MB':>8}")
+    for report in reports:
+        print(f"{report['scale']:>5} {report['contests']:>8} {report['charts']:>6} {report['rows']:>8} " +
+              " ".join(f"{report[step] * 1000:>9.1f}ms" for step in steps) +
+              f" {report['cycle']:>7.2f}s {report['rows_per_sec']:>9.0f} {report['peak_mb']:>8.1f}")
+
+    #Datawrapper takes three calls per chart, so estimate the real publishing time if the test didn't simulate it
+    largest = reports[-1]
+    publish_estimate = largest["publish"] if args.api_latency else largest["charts"] * 3 * 0.5
+    #Publishing overlaps with fetching in the streamed cycle, so take off the part of it that the test didn't wait for
+    estimate = largest["cycle"] - largest["publish"] + publish_estimate
+    print(f"\nAt scale {largest['scale']}, a cycle would take about {estimate:.0f} seconds "
+          f"(publishing {largest['charts']} charts {'as simulated' if args.api_latency else 'at ~0.5s per Datawrapper call'}). "
+          f"{'Fits' if estimate < CYCLE_BUDGET else 'Does NOT fit'} in the {CYCLE_BUDGET} second workflow budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Turns the raw API responses from each results source into one common row format.
+# Every row is a dict with the same keys, no matter where it came from:
+#   source, contest, candidate, party, votes, percent, reporting, fetched_at
+# "votes" is an int, "percent" and "reporting" are floats from 0-100 (reporting can be None if the source doesn't say)
+# Licensed under a GNU General Public License v3.0
+
+import datetime, re, pytz
+
+#Full party names for the party codes used by the California SOS API
+#NOTE: The data structure could change the way parties are represented, so this may need to be updated
+CAL_PARTIES = {
+    "Dem": "Democratic",
+    "Rep": "Republican",
+    "NPP": "No Party Preference",
+    "Lib": "Libertarian",
+    "P&F": "Peace and Freedom",
+    "Grn": "Green",
+}
+
+
+#Turn a vote count like "2,591,857" (or a plain number) into an int
+def to_votes(value):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    return int(float(value))
+
+
+#Turn a percentage like "28.1" (or a plain number) into a float
+def to_percent(value):
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+
+#The CA SOS API gives reporting as text like "100% (19,788 of 19,788) precincts reporting"
+def cal_reporting(text):
+    if not text:
+        return None
+    match = re.search(r"\(([\d,]+) of ([\d,]+)\)", text)
+    if match:
+        counted = to_votes(match.group(1))
+        total = to_votes(match.group(2))
+        if total:
+            return counted / total * 100
+    match = re.search(r"([\d.]+)%", text)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+#The CA SOS API gives the time a contest's results were last updated as text like "July 3, 2026, 3:37 p.m." (Pacific time)
+#Returns a unix time, or None if there isn't one we can read
+def cal_reporting_time(text):
+    if not text:
+        return None
+    text = text.replace("a.m.", "AM").replace("p.m.", "PM").replace("noon", "12:00 PM").replace("midnight", "12:00 AM")
+    try:
+        when = datetime.datetime.strptime(text, "%B %d, %Y, %I:%M %p")
+    except ValueError:
+        return None
+    return pytz.timezone('US/Pacific').localize(when).timestamp()
+
+
+#When the CA SOS last updated each contest, as {contest: unix time} (see freshness.py)
+def cal_updated_times(contests):
+    return {cal_contest_name(contst['raceTitle']): cal_reporting_time(contst.get("ReportingTime")) for contst in contests}
+
+
+#The contest name used for California races. This matches the name used for the CSV file
+def cal_contest_name(race_title):
+    return race_title.split('-', 1)[0].strip()
+
+
+#Rows for the California SOS "returns/query" response (a list of contests with candidates)
+def cal_sos_rows(contests, fetched_at):
+    rows = []
+    for contst in contests:
+        contest = cal_contest_name(contst['raceTitle'])
+        reporting = cal_reporting(contst.get("Reporting"))
+        for cand in contst.get('candidates', []):
+            #Add the incumbent tag to the name, just like the CSV files
+            if cand.get("incumbent") == True:
+                name = cand.get("Name") + " (Incumbent)"
+            else:
+                name = cand.get("Name")
+            rows.append({
+                "source": "ca_sos",
+                "contest": contest,
+                "candidate": name,
+                "party": CAL_PARTIES.get(cand.get("Party"), cand.get("Party") or ""),
+                "votes": to_votes(cand.get("Votes")),
+                "percent": to_percent(cand.get("Percent")),
+                "reporting": reporting,
+                "fetched_at": fetched_at,
+            })
+    return rows
+
+
+#Rows for a Clarity ENR summary.json (used for Shasta County)
+#If watched_contests is given, only those contests are kept
+def clarity_rows(contests, fetched_at, county="Shasta", watched_contests=None):
+    rows = []
+    source = f"clarity_{county.lower().replace(' ', '_')}"
+    for contest in contests:
+        if watched_contests is not None and contest['C'] not in watched_contests:
+            continue
+        #Precincts reporting out of total precincts
+        if contest.get('TP'):
+            reporting = contest.get('PR', 0) / contest['TP'] * 100
+        else:
+            reporting = None
+        parties = contest.get('P') or []
+        for i, (name, votes, percent) in enumerate(zip(contest.get('CH', []), contest.get('V', []), contest.get('PCT', []))):
+            rows.append({
+                "source": source,
+                "contest": contest['C'],
+                #Convert the candidate names to title case for better readability, same as the CSVs
+                "candidate": name.title(),
+                "party": parties[i] if i < len(parties) else "",
+                "votes": to_votes(votes),
+                "percent": to_percent(percent),
+                "reporting": reporting,
+                "fetched_at": fetched_at,
+            })
+    return rows
+
+
+#Rows for an Oregon GetMapData response ({"d": [one entry per candidate]})
+#Oregon gives percentages as decimals, so they are multiplied by 100
+#party is "DEM" or "REP" for one party's primary (like the party= of oregon_index.get_race)
+def oregon_rows(data, fetched_at, party=None):
+    rows = []
+    for race in data.get("d", []):
+        rows.append({
+            "source": "oregon",
+            #Each party's primary has the same race name, so the party is added to keep them apart
+            "contest": f"{race['RaceName']} ({party})" if party else race["RaceName"],
+            "candidate": race["calcCandidate"],
+            "party": race.get("PartyName") or "",
+            "votes": to_votes(race["calcCandidateVotes"]),
+            "percent": to_percent(race["calcCandidatePercentage"]) * 100,
+            "reporting": None,
+            "fetched_at": fetched_at,
+        })
+    return rows
+
+
+#Rows for the CA SOS "returns/ballot-measures" response, with Yes and No as the candidates
+def cal_prop_rows(data, fetched_at):
+    rows = []
+    for measure in data.get("ballot-measures", []):
+        for answer in ("yes", "no"):
+            rows.append({
+                "source": "ca_sos",
+                "contest": f"Proposition {measure['Number'].lstrip('0')}",
+                "candidate": answer.title(),
+                "party": "",
+                "votes": to_votes(measure.get(f"{answer}Votes")),
+                "percent": to_percent(measure.get(f"{answer}Percent")),
+                "reporting": cal_reporting(measure.get("Reporting")),
+                "fetched_at": fetched_at,
+            })
+    return rows
+
+
+#Group rows into {(source, contest): [rows]}, keeping the original order
+def by_contest(rows):
+    contests = {}
+    for row in rows:
+        contests.setdefault((row["source"], row["contest"]), []).append(row)
+    return contests
@@ -0,0 +1,184 @@
+# Builds an index of every Oregon race from one bulk "CTYALL, raceID=0" request, so the scrapers don't need one request per race.
+# The bulk listing has every race, seperated by county. The index adds the counties back together to get the same totals
+# a single-race request would give, in the same {"d": [...]} format, so the existing parsing code doesn't need to change.
+# Usage:
+#   a_data = oregon_index.get_race("300037829", "FED", party="DEM")
+# If a race isn't in the bulk listing, get_race falls back to the old single-race request.
+# Licensed under a GNU General Public License v3.0
+
+import time, requests
+
+import http_cache, profiling
+
+#NOTE: This API URL may change for future elections. See the readme for details on Oregon URLs
+BASE_URL = "https://orresultswebservices.azureedge.us/ResultsAjax.svc/GetMapData"
+
+#The keys the county can be stored under in the bulk listing
+COUNTY_KEYS = ("CountyName", "County", "CountyID")
+
+#The bulk listing for each category, as (time.monotonic() it was loaded, index). Fetched at most once per run,
+#or when running cells in a notebook, again once it's older than http_cache.NOTEBOOK_CACHE
+_indexes = {}
+
+#The categories whose bulk request failed, as (time.monotonic() it failed, error), so it isn't sent again for every race
+_failed = {}
+
+
+#Build the URL for a GetMapData request. All the parameters need to be filled in or no results show up
+def map_data_url(race_type, category="SW", race_id=0, party="0", county=0, extra=""):
+    return f"{BASE_URL}?type={race_type}&category={category}&raceID={race_id}&osn=0&county={county}&party={party}{extra}"
+
+
+#Guess the GetMapData type of a race from its name, for when we need to fall back to a single-race request
+def race_type(race_name):
+    name = race_name.lower()
+    if "state representative" in name:
+        return "HOUSE"
+    if "state senator" in name:
+        return "SENATE"
+    if "representative in congress" in name or "united states senator" in name:
+        return "FED"
+    if "measure" in name:
+        return "MEASURE"
+    return "SWPAR"
+
+
+#The county a bulk listing row is for, or None if it's a statewide total
+def county_of(row):
+    for key in COUNTY_KEYS:
+        if row.get(key) not in (None, ""):
+            return row[key]
+    return None
+
+
+#Build the index from a bulk GetMapData response
+#Returns {"by_id": {RaceID: race}, "by_name": {RaceName: [RaceID, ...]}}
+#Each race has its name, the parties on the ballot, a guessed type, the candidate rows added up across counties,
+#and the original county rows (used by county_results.py for county breakdowns)
+def build_index(data):
+    by_id = {}
+    for row in data.get("d", []):
+        race = by_id.setdefault(str(row["RaceID"]), {
+            "race_id": str(row["RaceID"]),
+            "race_name": row["RaceName"],
+            "type": race_type(row["RaceName"]),
+            "parties": set(),
+            "county_rows": [],
+            "statewide_rows": [],
+        })
+        if row.get("PartyName"):
+            race["parties"].add(row["PartyName"])
+        #Rows without a county are already statewide totals
+        if county_of(row) is None:
+            race["statewide_rows"].append(row)
+        else:
+            race["county_rows"].append(row)
+
+    by_name = {}
+    for race in by_id.values():
+        race["rows"] = race["statewide_rows"] or _add_up_counties(race["county_rows"])
+        del race["statewide_rows"]
+        by_name.setdefault(race["race_name"], []).append(race["race_id"])
+    return {"by_id": by_id, "by_name": by_name}
+
+
+#Add up the county rows for one race into one row per candidate
+#Percentages are worked out again from the totals, as decimals like the API gives them
+def _add_up_counties(county_rows):
+    totals = {}
+    for row in county_rows:
+        key = (row["calcCandidate"], row.get("PartyName") or "")
+        if key not in totals:
+            totals[key] = dict(row, calcCandidateVotes=0)
+            for county_key in COUNTY_KEYS:
+                totals[key].pop(county_key, None)
+        totals[key]["calcCandidateVotes"] += row["calcCandidateVotes"] or 0
+    return _with_percentages(list(totals.values()))
+
+
+#Work out each candidate's percentage of the rows' total votes, as decimals like the API gives them
+def _with_percentages(rows):
+    all_votes = sum(row["calcCandidateVotes"] or 0 for row in rows)
+    return [dict(row, calcCandidatePercentage=(row["calcCandidateVotes"] or 0) / all_votes if all_votes else 0) for row in rows]
+
+
+#Get the index for a category, making the bulk request the first time it's needed
+def load_index(category="SW", session=None):
+    if category in _indexes and (http_cache.NOTEBOOK_CACHE <= 0 or http_cache.notebook_fresh(_indexes[category][0])):
+        return _indexes[category][1]
+    #If it failed already, don't try again until the next run
+    if category in _failed and (http_cache.NOTEBOOK_CACHE <= 0 or http_cache.notebook_fresh(_failed[category][0])):
+        raise _failed[category][1]
+    try:
+        with profiling.tag(f"source=oregon bulk={category}"):
+            r = http_cache.get(map_data_url("CTYALL", category=category), session=session)
+            r.raise_for_status()
+            _indexes[category] = (time.monotonic(), build_index(r.json()))
+    except (requests.exceptions.RequestException, ValueError, KeyError) as err:
+        print(f"Couldn't load the Oregon {category} bulk listing, requesting races one at a time for the rest of the run:", err)
+        _failed[category] = (time.monotonic(), err)
+        raise
+    _failed.pop(category, None)
+    print(f"Loaded {len(_indexes[category][1]['by_id'])} Oregon races from the {category} bulk listing")
+    return _indexes[category][1]
+
+
+#The county= number for every county in the bulk listings loaded so far, as {"03": "Jackson"}
+def county_codes():
+    codes = {}
+    for loaded_at, index in _indexes.values():
+        for race in index["by_id"].values():
+            for row in race["county_rows"]:
+                code, name = row.get("CountyID"), row.get("CountyName") or row.get("County")
+                if code not in (None, "") and name:
+                    codes[f"{int(code):02d}" if str(code).isdigit() else str(code)] = name
+    return codes
+
+
+#Look up race IDs by race name, e.g. race_ids("Governor")
+def race_ids(race_name, category="SW", session=None):
+    return load_index(category, session)["by_name"].get(race_name, [])
+
+
+#Get one race's results in the same {"d": [...]} format as a single-race GetMapData request
+#party can be "DEM" or "REP" to only keep one party's candidates, like the party= URL parameter
+def get_race(race_id, race_type="SWPAR", category="SW", party="0", extra="", session=None):
+    try:
+        race = load_index(category, session)["by_id"].get(str(race_id))
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        race = None
+
+    if race is not None:
+        rows = race["rows"]
+        party_rows = for_party(rows, party)
+        #If the party's candidates were picked out, the percentages are worked out again, out of this party's votes only
+        if party_rows is not rows:
+            rows = _with_percentages(party_rows)
+        return {"d": rows}
+
+    #Not in the bulk listing, so fall back to asking for this race by itself
+    with profiling.tag(f"source=oregon race={race_id}"):
+        r = http_cache.get(map_data_url(race_type, category=category, race_id=race_id, party=party, extra=extra), session=session)
+        r.raise_for_status()
+        return r.json()
+
+
+#Only one party's rows, for party="DEM" or "REP" (or all of them for party="0"), like the party= URL parameter
+#Primaries can use a seperate RaceID for each party, in which case there's nothing to filter and the same list comes back
+def for_party(rows, party):
+    if party in ("0", 0, ""):
+        return rows
+    party_rows = [row for row in rows if _party_code(row.get("PartyName")) == party]
+    if party_rows and len(party_rows) < len(rows):
+        return party_rows
+    return rows
+
+
+def _party_code(party_name):
+    if not party_name:
+        return ""
+    if party_name.lower().startswith("democrat"):
+        return "DEM"
+    if party_name.lower().startswith("republican"):
+        return "REP"
+    return party_name
@@ -0,0 +1,153 @@
+# The steps of the California primary scraper (fetch, write CSVs, publish charts), pulled out so other scripts
+# (like livefeed.py and replay.py) can reuse them.
+# calprimary.py is still the script that runs everything on election night.
+# Licensed under a GNU General Public License v3.0
+
+import csv, json, os, time, pandas as pd
+
+import http_cache, normalize, profiling, retention
+
+#NOTE: Change this API URL to the correct one for the current election. Found at https://www.sos.ca.gov/media
+#The race IDs are the statewide and regional races we're tracking, they come from the API Endpoints CSV file provided by the Cal SOS
+CAL_STATEWIDE_URL = 'https://api.sos.ca.gov/returns/query?r=["02000000000059", "03000000000059", "04000000000059", "07000000000059", "11000001000059", "11000002000059", "12000002000059", "13000001000059", "13000002000059"]'
+
+#Clarity doesn't like requests that don't look like they come from a browser (see clarity.py, which has the county URLs)
+CLARITY_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:151.0) Gecko/20100101 Firefox/151.0',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-GPC': '1',
+    'Upgrade-Insecure-Requests': '1', # You can add more headers if needed
+}
+
+
+#Grab the statewide results from the California SOS
+def fetch_statewide(session=None, timeout=30):
+    with profiling.tag("source=ca_sos"):
+        r = http_cache.get(CAL_STATEWIDE_URL, session=session, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+
+#Save a raw API response to the jsons folder, named with the date and time, and return the filename
+def save_snapshot(data, prefix, timenow, folder="jsons"):
+    filename = f"{folder}/{prefix}_{timenow}.json"
+    with open(filename, "w") as outfile:
+        json.dump(data, outfile)
+    #Track it so retention.py knows when to thin it out or archive it
+    retention.register(filename)
+    print(f"Saved {prefix} to {filename}")
+    return filename
+
+
+#The CSV file for a statewide contest, e.g. "California_Governor_results.csv"
+def statewide_csv_name(contest):
+    return f"California_{contest.replace(' ', '_').replace('.', '')}_results.csv"
+
+
+#The CSV file for a Shasta County contest, e.g. "County Clerk_results_clean.csv"
+def shasta_csv_name(contest):
+    return f"{contest}_results_clean.csv"
+
+
+#Write one CSV per statewide contest from the normalized rows (see normalize.py)
+def write_statewide_csvs(rows, out_dir="."):
+    written = []
+    for (source, contest), contest_rows in normalize.by_contest(rows).items():
+        csv_filename = os.path.join(out_dir, statewide_csv_name(contest))
+        with open(csv_filename, 'w', newline='') as file:
+            # Write the header row
+            csv_headers = ["Candidate", "Party", "Votes", "Percent"]
+            writer = csv.DictWriter(file, fieldnames=csv_headers)
+            writer.writeheader()
+            # Write each candidate's data to the CSV
+            for row in contest_rows:
+                writer.writerow({
+                    "Candidate": row["candidate"],
+                    "Party": row["party"],
+                    "Votes": row["votes"],
+                    "Percent": row["percent"]
+                })
+        print(f"Saved {contest} results to {csv_filename}")
+        written.append(csv_filename)
+    return written
+
+
+#Write one CSV per watched Shasta County contest from the normalized rows
+#Other Clarity counties use the same layout, with their own csv_name (see clarity.py)
+def write_shasta_csvs(rows, out_dir=".", csv_name=shasta_csv_name):
+    written = []
+    for (source, contest), contest_rows in normalize.by_contest(rows).items():
+        clean_name = os.path.join(out_dir, csv_name(contest))
+        with open(clean_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            #Check if the contest is a measure, which will use a different header.
+            if contest.startswith("Measure"):
+                writer.writerow(["Result", "Votes", "Percent"]) # Write header for measure
+            else:
+                writer.writerow(["Candidate", "Votes", "Percent"])  # Write header
+            for row in contest_rows:
+                writer.writerow([row["candidate"], row["votes"], row["percent"]])  # Write data rows
+        written.append(clean_name)
+    return written
+
+
+#Only the races (from calraces.json or shastaraces.json) whose contest changed this cycle. See diff.py
+#changed is a list of (source, contest) keys, and csv_name is statewide_csv_name or shasta_csv_name
+#Each race that's kept gets its (source, contest) key added as "contest"
+def changed_races(races, changed, csv_name):
+    changed_files = {csv_name(key[1]): key for key in changed}
+    return [dict(race, contest=changed_files[race.get("filename")]) for race in races if race.get("filename") in changed_files]
+
+
+#The new contest states to save for the next run (see diff.py), leaving out contests whose chart was skipped,
+#so those charts are still seen as changed and get published next run
+def published_states(current, races, published, csv_name):
+    skipped_files = {race.get("filename") for race in races if race.get("Key") not in published}
+    return {key: contest_state for key, contest_state in current.items() if csv_name(key[1]) not in skipped_files}
+
+
+#Update and republish the Datawrapper charts listed in races (from calraces.json or shastaraces.json)
+#races is a list of {"filename": CSV file, "Key": chart ID}
+#If a scheduler is given (see scheduler.py), the charts are published in priority order and low priority ones
+#are skipped if there isn't time before the deadline
+#If a freshness tracker is given (see freshness.py), the time each contest's chart went live is recorded
+def publish_charts(dw, races, latest_time, out_dir=".", scheduler=None, tracker=None):
+    published = []
+    if scheduler is not None:
+        races = scheduler.ordered(races)
+    for race in races:
+        if scheduler is not None and not scheduler.should_publish(race):
+            continue
+        started = time.monotonic()
+        filename = os.path.join(out_dir, race.get("filename"))
+        print(f"Updating {race.get('filename')}")
+        # Try UTF-8 encoding first, then fall back to cp1252 if that fails (for files with special characters like accents)
+        try:
+            new_data = pd.read_csv(filename, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            new_data = pd.read_csv(filename, encoding="cp1252")
+        #Update the metadata to include an annotation with the last updated time
+        metadata = {
+                    "annotate": {
+                        #NOTE: Change "PST" to "PDT" if the current time is in Daylight Saving Time
+                        "notes": f"Last updated: {latest_time} PDT"
+                    }
+                }
+        #Update chart data/metadata and publish
+        chart_id = race.get("Key")
+        with profiling.tag(f"chart={chart_id}"):
+            dw.add_data(chart_id=chart_id, data=new_data)
+            dw.update_metadata(chart_id=chart_id, metadata=metadata)
+            dw.publish_chart(chart_id=chart_id)
+        published.append(chart_id)
+        if scheduler is not None:
+            scheduler.chart_published(race, time.monotonic() - started)
+        if tracker is not None and "contest" in race:
+            tracker.mark([race["contest"]], "published")
+    return published
@@ -0,0 +1,146 @@
+# A profiling mode for the scrapers, to find out why a run is slow on election night
+# (network, JSON decoding, pandas, disk or Datawrapper).
+# Run any scraper with --profile, e.g. python calprimary.py --profile, and when it finishes, profiles/ will have:
+#   <script>_<time>.prof    - a cProfile trace, open it with snakeviz or python -m pstats
+#   <script>_<time>.folded  - sampled stacks in the folded format flame graph tools read
+#                             (flamegraph.pl, speedscope.app, inferno), one line per stack with how many samples it got
+#   <script>_<time>.txt     - the run report: the slowest functions, and the time spent on each source and chart
+# Each sampled stack starts with what the scraper was working on, like "source=ca_sos" or "chart=ABC12",
+# which the code marks with profiling.tag(). Tagging costs next to nothing when profiling is off.
+# The fetching, processing and publishing run in their own threads (see streaming.py), so each thread started while
+# profiling gets its own cProfile, and they're all added together in the report.
+# Licensed under a GNU General Public License v3.0
+
+import atexit, collections, contextlib, cProfile, datetime, io, os, pstats, sys, threading, time
+
+FOLDER = "profiles"
+
+#How often the sampler looks at every thread's stack, in seconds
+SAMPLE_INTERVAL = 0.005
+
+#The tags each thread is inside of right now, {thread id: [tags]}
+_tags = collections.defaultdict(list)
+
+_profiler = None
+#The profilers for the other threads, before Python 3.12 (from 3.12 one cProfile sees every thread)
+_thread_profilers = []
+_thread_lock = threading.Lock()
+_sampler = None
+_stop = threading.Event()
+_samples = collections.Counter()
+_tag_seconds = collections.Counter()
+_started = None
+_name = None
+
+
+#Mark what the code in the with block is working on, e.g. with profiling.tag("chart=ABC12"):
+@contextlib.contextmanager
+def tag(label):
+    tags = _tags[threading.get_ident()]
+    tags.append(label)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        tags.pop()
+        #Threads come and go (one per source every cycle), so don't keep an empty list for each one
+        if not tags:
+            _tags.pop(threading.get_ident(), None)
+        if _profiler is not None:
+            _tag_seconds[label] += time.perf_counter() - started
+
+
+#One "frame" of a folded stack: file:function
+def _frame_name(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def _sample():
+    me = threading.get_ident()
+    while not _stop.wait(SAMPLE_INTERVAL):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            _samples[";".join(list(_tags.get(thread_id, [])) + stack[::-1])] += 1
+
+
+#Runs first thing in every thread started while profiling, and starts that thread's own profiler
+def _profile_thread(frame, event, arg):
+    profiler = cProfile.Profile()
+    with _thread_lock:
+        _thread_profilers.append(profiler)
+    profiler.enable()
+
+
+#Start profiling if the script was run with --profile. Call this at the top of a scraper
+def start_if_requested(name=None):
+    if "--profile" in sys.argv:
+        sys.argv.remove("--profile")
+        start(name)
+        #Write the profiles when the script finishes
+        atexit.register(stop)
+
+
+def start(name=None):
+    global _profiler, _sampler, _started, _name
+    if _profiler is not None:
+        return
+    _name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "profile"
+    _started = datetime.datetime.now()
+    _samples.clear()
+    _tag_seconds.clear()
+    _stop.clear()
+    _sampler = threading.Thread(target=_sample, daemon=True)
+    _sampler.start()
+    _thread_profilers.clear()
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    if sys.version_info < (3, 12):
+        threading.setprofile(_profile_thread)
+    print(f"Profiling {_name}")
+
+
+#Stop profiling and write the files, returns the path of the report
+def stop():
+    global _profiler
+    if _profiler is None:
+        return None
+    _profiler.disable()
+    threading.setprofile(None)
+    _stop.set()
+    _sampler.join()
+    profiler, _profiler = _profiler, None
+    #Add the other threads' profiles to the main thread's
+    stats = pstats.Stats(profiler)
+    with _thread_lock:
+        for thread_profiler in _thread_profilers:
+            thread_profiler.disable()
+            stats.add(thread_profiler)
+        _thread_profilers.clear()
+
+    if not os.path.exists(FOLDER):
+        os.makedirs(FOLDER)
+    base = os.path.join(FOLDER, f"{_name}_{_started.strftime('%Y-%m-%d_%H-%M-%S')}")
+    stats.dump_stats(base + ".prof")
+    with open(base + ".folded", "w") as f:
+        for stack, count in _samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    #The report: time per tag first, then the functions that took the longest
+    elapsed = (datetime.datetime.now() - _started).total_seconds()
+    out = io.StringIO()
+    out.write(f"Profile of {_name}, started {_started.isoformat(timespec='seconds')}, took {elapsed:.2f} seconds\n\n")
+    out.write("Time spent on each source and chart:\n")
+    for label, seconds in sorted(_tag_seconds.items(), key=lambda item: item[1], reverse=True):
+        out.write(f"  {seconds:8.3f}s  {label}\n")
+    out.write("\n")
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(40)
+    with open(base + ".txt", "w") as f:
+        f.write(out.getvalue())
+    print(f"Profile saved to {base}.txt, {base}.prof and {base}.folded")
+    return base + ".txt"
@@ -0,0 +1,88 @@
+# Works out whether each race can still flip, for every contest at once.
+# For each contest it finds:
+#   - the margin between first and second place (and second and third, since the top two advance in a California primary)
+#   - an estimate of the ballots still out, from the votes counted so far and the percent reporting
+#   - the share of the outstanding two-way vote the trailing candidate would need to catch up
+# Everything is done on whole columns at once, so hundreds of contests take milliseconds.
+# Licensed under a GNU General Public License v3.0
+
+import os, numpy as np, pandas as pd
+
+SUMMARY_FILE = "race_projections.csv"
+
+#Sources where all precincts reporting doesn't mean the count is done. California counts mail ballots for weeks after
+#election night, so a contest at 100% of precincts still has an unknown number of ballots out
+#NOTE: Matched against the start of the source name (see normalize.py). Add any other California sources here
+MAIL_COUNT_SOURCES = ("ca_sos", "clarity_")
+
+
+#Share of the outstanding two-way vote the trailing candidate needs to make up the margin
+#More than 100% means they can't catch up, blank means there's nothing left to count (or we don't know)
+def needed_share(margin, outstanding):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = (outstanding + margin) / (2 * outstanding) * 100
+    return np.where(outstanding > 0, share, np.nan)
+
+
+#Build the summary table from this cycle's normalized rows (see normalize.py)
+#If previous is the last summary table, a "Votes Added" column shows how much was counted since then
+def summarize(rows, previous=None):
+    df = pd.DataFrame(rows, columns=["source", "contest", "candidate", "votes", "reporting"])
+    if df.empty:
+        return pd.DataFrame()
+
+    #Rank the candidates in each contest by votes
+    df = df.sort_values(["source", "contest", "votes"], ascending=[True, True, False], kind="stable")
+    df["rank"] = df.groupby(["source", "contest"], sort=False).cumcount()
+    contests = df.groupby(["source", "contest"], sort=False)
+    summary = pd.DataFrame({
+        "Total Votes": contests["votes"].sum(),
+        "Reporting %": contests["reporting"].first(),
+        "Candidates": contests["candidate"].size(),
+    })
+
+    #Put the top three candidates' names and votes side by side
+    top = df[df["rank"] < 3].pivot(index=["source", "contest"], columns="rank", values=["candidate", "votes"])
+    top = top.reindex(summary.index)
+    for place, label in enumerate(["First", "Second", "Third"]):
+        summary[label] = top["candidate"][place] if place in top["candidate"] else ""
+        summary[f"{label} Votes"] = top["votes"][place] if place in top["votes"] else 0
+    summary[["First Votes", "Second Votes", "Third Votes"]] = summary[["First Votes", "Second Votes", "Third Votes"]].fillna(0)
+    summary[["First", "Second", "Third"]] = summary[["First", "Second", "Third"]].fillna("")
+
+    total = summary["Total Votes"].to_numpy(dtype=float)
+    reporting = summary["Reporting %"].to_numpy(dtype=float)
+    first = summary["First Votes"].to_numpy(dtype=float)
+    second = summary["Second Votes"].to_numpy(dtype=float)
+    third = summary["Third Votes"].to_numpy(dtype=float)
+
+    summary["Margin"] = (first - second).astype(int)
+    summary["Margin %"] = np.round(np.divide(first - second, total, out=np.zeros_like(total), where=total > 0) * 100, 2)
+    #If X% is reporting and we've counted V votes, we expect about V * (100 - X) / X more
+    #Unknown if the source doesn't say how much is reporting, or if every precinct is in but mail ballots are still being counted
+    with np.errstate(divide="ignore", invalid="ignore"):
+        outstanding = np.where(reporting > 0, total * (100 - reporting) / reporting, np.nan)
+    outstanding = np.clip(outstanding, 0, None)
+    mail_count = summary.index.get_level_values("source").str.startswith(MAIL_COUNT_SOURCES)
+    outstanding = np.where(mail_count & (reporting >= 100), np.nan, outstanding)
+    summary["Est. Outstanding"] = np.round(outstanding)
+    summary["Second Needs %"] = np.round(needed_share(first - second, outstanding), 1)
+    summary["Third Needs %"] = np.round(needed_share(second - third, outstanding), 1)
+    #Can the result change? Unknown if we don't know how much is left
+    summary["Can Flip"] = np.where(np.isnan(outstanding), "Unknown",
+                                   np.where(summary["Second Needs %"].to_numpy() <= 100, "Yes", "No"))
+
+    if previous is not None and not previous.empty:
+        before = previous.set_index(["source", "contest"])["Total Votes"]
+        summary["Votes Added"] = (summary["Total Votes"] - before.reindex(summary.index)).fillna(0).astype(int)
+
+    return summary.reset_index()
+
+
+#Build the summary for this cycle, compare it to the last one, and save it
+def save_summary(rows, filename=SUMMARY_FILE):
+    previous = pd.read_csv(filename) if os.path.isfile(filename) else None
+    summary = summarize(rows, previous)
+    summary.to_csv(filename, index=False)
+    print(f"Saved projections for {len(summary)} contests to {filename}")
+    return summary
@@ -0,0 +1,172 @@
+# Replays the saved snapshots in jsons/ through the whole pipeline (normalize -> write CSVs -> publish charts),
+# so we can rehearse an election night in minutes, and profile the pipeline with a realistic burst of changes.
+# Nothing is sent to Datawrapper: charts are "published" to a fake client that just records the calls.
+# The CSVs are written to replay_output/ so the real ones aren't touched.
+# Usage: python replay.py --speed 60
+#   --speed 60 plays back 60 times faster than real time, --speed 0 plays as fast as possible
+# Licensed under a GNU General Public License v3.0
+
+import argparse, datetime, json, os, re, time, pytz
+
+import clarity, diff, normalize, pipeline, retention
+
+#The snapshot files we know how to replay, as {snapshot prefix: source}, with how to turn each one into normalized rows,
+#write its CSVs, and name the CSV for a contest, and its charts. The Clarity counties come from clarity_counties.json,
+#like calprimary.py, so each county's snapshots (<county>_results) get their own source name, contests and charts
+def load_sources():
+    with open('calraces.json') as f:
+        sources = {"california_cands": {
+            "rows": normalize.cal_sos_rows,
+            "write": pipeline.write_statewide_csvs,
+            "csv_name": pipeline.statewide_csv_name,
+            "races": json.load(f)}}
+    for county in clarity.load_counties():
+        sources[clarity.snapshot_prefix(county)] = {
+            "rows": lambda data, fetched_at, county=county: normalize.clarity_rows(data, fetched_at, county["county"], county["watched_contests"]),
+            "write": lambda rows, out_dir, county=county: pipeline.write_shasta_csvs(rows, out_dir, clarity.csv_namer(county)),
+            "csv_name": clarity.csv_namer(county),
+            "races": county["races"]}
+    return sources
+
+
+#Snapshots that can be read into rows but have no charts to replay here (JPRscraper.py and Mayscraper.py save them),
+#for results_archive.py. Every Oregon snapshot (oregon_leg, oregon_CD2, ...) is a GetMapData response
+OTHER_SOURCES = {
+    "california_props": normalize.cal_prop_rows,
+}
+
+
+#How to turn a snapshot into rows, as rows(data, fetched_at), from its source (the start of its filename),
+#or None if we can't read it. sources is from load_sources()
+def rows_for(source, sources):
+    if source in sources:
+        return sources[source]["rows"]
+    if source in OTHER_SOURCES:
+        return OTHER_SOURCES[source]
+    if source.startswith("oregon_"):
+        return normalize.oregon_rows
+    return None
+
+#Snapshot filenames are in Pacific time, and the snapshot times are given back in Pacific time too
+pacific_tz = pytz.timezone('US/Pacific')
+
+
+#Stands in for the Datawrapper client. Records every call, and can wait a bit on each one to act like the real API
+class FakeDatawrapper:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+
+    def _call(self, name, chart_id):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls.append((name, chart_id))
+
+    def add_data(self, chart_id, data):
+        self._call("add_data", chart_id)
+
+    def update_metadata(self, chart_id, metadata):
+        self._call("update_metadata", chart_id)
+
+    def publish_chart(self, chart_id):
+        self._call("publish_chart", chart_id)
+
+
+#Find every snapshot in the folder, and return [(time, source, load)] in the order they were taken
+#load() reads the snapshot when it's needed. sources is the sources to look for, e.g. from load_sources()
+def find_snapshots(sources, folder="jsons"):
+    snapshots = []
+    for filename in os.listdir(folder):
+        match = re.match(r"(.+)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.json$", filename)
+        if match and match.group(1) in sources:
+            taken = pacific_tz.localize(datetime.datetime.strptime(match.group(2), "%Y-%m-%d_%H-%M"))
+            snapshots.append((taken, match.group(1), lambda path=os.path.join(folder, filename): _read(path)))
+    return sorted(snapshots, key=lambda snapshot: snapshot[:2])
+
+
+#The same, but also including the older snapshots that retention.py has compacted into jsons/archive/
+def find_archived_snapshots(sources):
+    snapshots = []
+    for source in sources:
+        for taken, data in retention.iter_snapshots(source):
+            snapshots.append((datetime.datetime.fromtimestamp(taken, tz=pacific_tz), source, lambda data=data: data))
+    return sorted(snapshots, key=lambda snapshot: snapshot[:2])
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+#Run one snapshot through the pipeline, and return (events, new contest states, how long each step took)
+#source is the snapshot's entry from load_sources()
+def run_snapshot(source, load, taken, dw, out_dir, previous):
+    timings = {}
+    started = time.perf_counter()
+    data = load()
+    timings["load"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rows = source["rows"](data, taken.isoformat())
+    timings["normalize"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    source["write"](rows, out_dir)
+    timings["write"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    events, changed, current = diff.compare(previous, rows)
+    timings["diff"] = time.perf_counter() - started
+
+    #Like calprimary.py, only republish the charts for contests that changed
+    started = time.perf_counter()
+    pipeline.publish_charts(dw, pipeline.changed_races(source["races"], changed, source["csv_name"]),
+                            taken.strftime("%m/%d/%Y, %I:%M %p"), out_dir)
+    timings["publish"] = time.perf_counter() - started
+    return rows, events, current, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay saved snapshots through the pipeline")
+    parser.add_argument("--speed", type=float, default=60, help="How many times faster than real time, 0 for no waiting")
+    parser.add_argument("--folder", default="jsons", help="Where the snapshots are")
+    parser.add_argument("--out", default="replay_output", help="Where to write the replayed CSVs")
+    parser.add_argument("--archive", action="store_true", help="Also replay the snapshots archived by retention.py")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds the fake Datawrapper waits on each call")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+    sources = load_sources()
+    snapshots = find_archived_snapshots(sources) if args.archive else find_snapshots(sources, args.folder)
+    if not snapshots:
+        print(f"No snapshots to replay in {args.folder}")
+        return
+    print(f"Replaying {len(snapshots)} snapshots from {snapshots[0][0]} to {snapshots[-1][0]} at {args.speed}x")
+
+    dw = FakeDatawrapper(latency=args.api_latency)
+    totals = {"load": 0.0, "normalize": 0.0, "write": 0.0, "diff": 0.0, "publish": 0.0}
+    previous = {}
+    event_count = 0
+    replay_started = time.monotonic()
+    for taken, source, load in snapshots:
+        #Wait until this snapshot would have come in, sped up
+        if args.speed > 0:
+            due = (taken - snapshots[0][0]).total_seconds() / args.speed
+            time.sleep(max(0, due - (time.monotonic() - replay_started)))
+        rows, events, current, timings = run_snapshot(sources[source], load, taken, dw, args.out, previous)
+        for step, seconds in timings.items():
+            totals[step] += seconds
+        previous.update(current)
+        event_count += len(events)
+        print(f"{taken} {source}: {len(rows)} rows, {len(events)} changes, " +
+              ", ".join(f"{step} {seconds * 1000:.1f}ms" for step, seconds in timings.items()))
+
+    print(f"\nReplayed {len(snapshots)} snapshots in {time.monotonic() - replay_started:.1f} seconds")
+    print(f"{event_count} changes, {len(dw.calls)} Datawrapper calls")
+    for step, seconds in totals.items():
+        print(f"  {step}: {seconds * 1000:.1f}ms total, {seconds * 1000 / len(snapshots):.1f}ms per snapshot")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# Packs every saved snapshot's normalized results (see normalize.py) into one binary file, so looking at the whole night
+# afterwards doesn't mean opening hundreds of JSON files and running json.load on each one.
+# The file is read with mmap, so only the parts that are looked at are read from disk, and the results come back as
+# numpy arrays that point straight at the file instead of copies. A view stays valid for as long as it's kept, even after
+# the archive is closed: the file is only unmapped once the last view is gone.
+# The file is laid out as:
+#   header   - HEADER: magic, version, how many strings, contests and records, and where each part starts
+#   strings  - every source, contest, candidate and party name once, as (string count + 1) uint32 offsets, then the UTF-8 text
+#   index    - one INDEX_DTYPE entry per contest: its source and name, and where its records start and how many there are
+#   records  - one RECORD_DTYPE per candidate per snapshot, sorted by contest, then candidate, then time,
+#              so all of a contest's records are next to each other, and so are each candidate's within it
+# Usage:
+#   python results_archive.py build                  # pack every source's snapshots in jsons/ (--archive adds the ones retention.py archived)
+#   python results_archive.py show ca_sos Governor   # print a contest's vote totals over time
+#   with results_archive.Archive() as archive:
+#       times, votes = archive.totals("ca_sos", "Governor")["Gavin Newsom"]
+# Licensed under a GNU General Public License v3.0
+
+import argparse, mmap, os, struct, time, numpy as np, pandas as pd
+
+import replay, retention
+
+ARCHIVE_FILE = "results_archive.bin"
+
+MAGIC = b"JPRARCH\x00"
+VERSION = 2
+
+#magic, version, string count, contest count, record count, then where the strings, index and records start
+HEADER = struct.Struct("<8sIIIQQQQ")
+
+#One candidate's results in one snapshot. fetched_at is microseconds since 1970 (UTC), reporting is NaN when it's unknown
+#contest is the contest's position in the index, candidate and party are positions in the string table
+RECORD_DTYPE = np.dtype([
+    ("fetched_at", "<i8"),
+    ("votes", "<i8"),
+    ("percent", "<f8"),
+    ("reporting", "<f8"),
+    ("contest", "<u4"),
+    ("candidate", "<u4"),
+    ("party", "<u4"),
+])
+
+INDEX_DTYPE = np.dtype([
+    ("source", "<u4"),
+    ("contest", "<u4"),
+    ("start", "<u8"),
+    ("count", "<u8"),
+])
+
+
+def _align(position):
+    return (position + 7) // 8 * 8
+
+
+#Write the rows to an archive file, replacing it. Returns how many records were written
+def write(rows, path=ARCHIVE_FILE):
+    df = pd.DataFrame(rows, columns=["source", "contest", "candidate", "party", "votes", "percent", "reporting", "fetched_at"])
+    fetched_at = pd.to_datetime(df["fetched_at"], utc=True, format="ISO8601")
+    df["fetched_at"] = (fetched_at - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(microseconds=1)
+    df = df.sort_values(["source", "contest", "candidate", "fetched_at"], kind="stable").reset_index(drop=True)
+
+    #Every name is stored once, and the records point at it
+    strings = pd.Index(pd.unique(pd.concat([df["source"], df["contest"], df["candidate"], df["party"]], ignore_index=True)))
+    encoded = [name.encode("utf-8") for name in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(name) for name in encoded])
+    blob = b"".join(encoded)
+
+    contests = df[["source", "contest"]].drop_duplicates()
+    index = np.zeros(len(contests), dtype=INDEX_DTYPE)
+    index["source"] = strings.get_indexer(contests["source"])
+    index["contest"] = strings.get_indexer(contests["contest"])
+    index["start"] = contests.index.to_numpy()
+    index["count"] = np.diff(np.append(index["start"], len(df)))
+
+    records = np.zeros(len(df), dtype=RECORD_DTYPE)
+    records["fetched_at"] = df["fetched_at"].to_numpy()
+    records["votes"] = df["votes"].to_numpy()
+    records["percent"] = df["percent"].to_numpy()
+    records["reporting"] = df["reporting"].astype("float64").to_numpy()
+    records["contest"] = np.repeat(np.arange(len(index)), index["count"].astype("int64"))
+    records["candidate"] = strings.get_indexer(df["candidate"])
+    records["party"] = strings.get_indexer(df["party"])
+
+    strings_at = HEADER.size
+    index_at = _align(strings_at + offsets.nbytes + len(blob))
+    records_at = _align(index_at + index.nbytes)
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded), len(index), len(records), strings_at, index_at, records_at))
+        f.write(offsets.tobytes())
+        f.write(blob)
+        f.write(b"\x00" * (index_at - f.tell()))
+        f.write(index.tobytes())
+        f.write(b"\x00" * (records_at - f.tell()))
+        f.write(records.tobytes())
+    os.replace(path + ".tmp", path)
+    print(f"Wrote {len(records)} records for {len(index)} contests to {path}")
+    return len(records)
+
+
+#Reads an archive. The arrays it returns are views of the file, and stay valid until they're deleted, even after close()
+class Archive:
+    def __init__(self, path=ARCHIVE_FILE):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, string_count, contest_count, record_count, strings_at, index_at, records_at = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} isn't a version {VERSION} results archive")
+        offsets = np.frombuffer(self._map, dtype="<u4", count=string_count + 1, offset=strings_at)
+        blob = self._map[strings_at + offsets.nbytes:strings_at + offsets.nbytes + int(offsets[-1])]
+        self.strings = [blob[start:end].decode("utf-8") for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=contest_count, offset=index_at)
+        self.records = np.frombuffer(self._map, dtype=RECORD_DTYPE, count=record_count, offset=records_at)
+        self._contests = {(self.strings[source], self.strings[contest]): position
+                          for position, (source, contest) in enumerate(zip(self.index["source"].tolist(), self.index["contest"].tolist()))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        #The map can only be closed once nothing points at it. If views from contest() or totals() are still being used,
+        #it's left open, and is closed when the last of them is deleted
+        self.index = self.records = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+        self._map = None
+        #The map has its own copy of the file handle, so this one can always be closed
+        self._file.close()
+
+    #Every (source, contest) in the archive
+    def contests(self):
+        return list(self._contests)
+
+    #A contest's records, as a view of the file, sorted by candidate then time
+    def contest(self, source, contest):
+        entry = self.index[self._contests[(source, contest)]]
+        return self.records[entry["start"]:entry["start"] + entry["count"]]
+
+    #Each candidate's vote totals over time, as {candidate: (times, votes)}. times is numpy datetime64 (UTC)
+    #Each candidate's records are next to each other in the file, so both arrays are views of it too
+    def totals(self, source, contest):
+        records = self.contest(source, contest)
+        candidates = records["candidate"]
+        starts = np.append(0, np.flatnonzero(np.diff(candidates)) + 1).tolist()
+        ends = starts[1:] + [len(records)]
+        times = records["fetched_at"].view("datetime64[us]")
+        votes = records["votes"]
+        return {self.strings[int(candidates[start])]: (times[start:end], votes[start:end]) for start, end in zip(starts, ends)}
+
+    #A contest's records as a pandas DataFrame, with the names filled back in
+    def to_frame(self, source, contest):
+        records = self.contest(source, contest)
+        return pd.DataFrame({
+            "source": source,
+            "contest": contest,
+            "candidate": [self.strings[candidate] for candidate in records["candidate"].tolist()],
+            "party": [self.strings[party] for party in records["party"].tolist()],
+            "votes": records["votes"],
+            "percent": records["percent"],
+            "reporting": records["reporting"],
+            "fetched_at": pd.to_datetime(records["fetched_at"], unit="us", utc=True),
+        })
+
+
+#Normalize every saved snapshot (like replay.py) and pack them into an archive
+#Every source replay.py can read is packed, including Oregon and the California propositions, which it doesn't replay
+def build(path=ARCHIVE_FILE, folder="jsons", archived=False):
+    known = replay.load_sources()
+    sources = retention.sources() if archived else {retention.source_of(filename) for filename in os.listdir(folder)}
+    readers = {source: replay.rows_for(source, known) for source in sources if replay.rows_for(source, known) is not None}
+    snapshots = replay.find_archived_snapshots(readers) if archived else replay.find_snapshots(readers, folder)
+    rows = []
+    for taken, source, load in snapshots:
+        #The snapshot times are already in Pacific time (see replay.py)
+        rows += readers[source](load(), taken.isoformat())
+    if not rows:
+        print(f"No snapshots to archive in {folder}")
+        return 0
+    print(f"Read {len(snapshots)} snapshots")
+    return write(rows, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the saved snapshots into one file, and read it back")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Pack the snapshots into the archive")
+    build_parser.add_argument("--folder", default="jsons", help="Where the snapshots are")
+    build_parser.add_argument("--archive", action="store_true", help="Also pack the snapshots archived by retention.py")
+    build_parser.add_argument("--out", default=ARCHIVE_FILE, help="The archive file to write")
+    show_parser = subparsers.add_parser("show", help="Print a contest's vote totals over time")
+    show_parser.add_argument("source", help="e.g. ca_sos, clarity_shasta, oregon")
+    show_parser.add_argument("contest", help="e.g. Governor")
+    show_parser.add_argument("--file", default=ARCHIVE_FILE, help="The archive file to read")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.out, args.folder, args.archive)
+        return
+    started = time.perf_counter()
+    with Archive(args.file) as archive:
+        df = archive.to_frame(args.source, args.contest)
+        print(df.pivot_table(index="fetched_at", columns="candidate", values="votes").to_string())
+    print(f"Read {len(df)} records in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Writes one results file per election (results/2026-ca-primary.csv), instead of committing two dozen chart CSVs every run.
+# The chart CSVs are only needed to send the data to Datawrapper, so in the workflow they're written to build/ (which isn't
+# committed) and uploaded as a workflow artifact, and only the bundle is committed.
+# The bundle is written so a run only changes the lines that really changed:
+#   - rows are always in the same order (source, contest, candidate), and numbers are always written the same way
+#   - each row's Updated time is only changed when that candidate's results change
+#   - the file isn't rewritten at all if nothing changed
+# The chart CSVs can be made again from a bundle whenever they're needed:
+#   python results_bundle.py csvs 2026-ca-primary --out build
+# Usage: results_bundle.write(cycle_rows, "2026-ca-primary")   # at the end of a scraper run
+# Licensed under a GNU General Public License v3.0
+
+import argparse, csv, io, os
+
+import clarity, pipeline
+
+FOLDER = "results"
+
+COLUMNS = ["Source", "Contest", "Candidate", "Party", "Votes", "Percent", "Reporting", "Updated"]
+
+
+def bundle_name(election, folder=FOLDER):
+    return os.path.join(folder, f"{election}.csv")
+
+
+#The bundle's line for one candidate, without the Updated time
+def _line(row):
+    reporting = "" if row["reporting"] is None else f"{row['reporting']:.2f}"
+    return [row["source"], row["contest"], row["candidate"], row["party"], str(row["votes"]), f"{row['percent']:.2f}", reporting]
+
+
+#Read a bundle back as {(source, contest, candidate): (line without the Updated time, Updated time)}
+def _read(filename):
+    lines = {}
+    if not os.path.isfile(filename):
+        return lines
+    with open(filename, newline="", encoding="utf-8") as f:
+        for line in list(csv.reader(f))[1:]:
+            lines[tuple(line[:3])] = (line[:7], line[7])
+    return lines
+
+
+#Write this run's rows to the election's bundle. Returns whether the file changed
+def write(rows, election, folder=FOLDER):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    filename = bundle_name(election, folder)
+    previous = _read(filename)
+    #A line's Updated time only changes when the line does
+    lines = {}
+    for row in rows:
+        line = _line(row)
+        key = tuple(line[:3])
+        lines[key] = (line, previous[key][1] if key in previous and previous[key][0] == line else row["fetched_at"])
+    #Contests that weren't in this run (e.g. the fetch failed) keep their last results
+    contests = {key[:2] for key in lines}
+    for key, (line, updated) in previous.items():
+        if key[:2] not in contests:
+            lines[key] = (line, updated)
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    writer.writerows(lines[key][0] + [lines[key][1]] for key in sorted(lines))
+    text = output.getvalue()
+    if os.path.isfile(filename):
+        with open(filename, encoding="utf-8") as f:
+            if f.read() == text:
+                print(f"No changes to {filename}")
+                return False
+    with open(filename + ".tmp", "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    os.replace(filename + ".tmp", filename)
+    changed = sum(1 for key in lines if previous.get(key) != lines[key])
+    print(f"Wrote {filename}: {changed} of {len(lines)} lines changed")
+    return True
+
+
+#Turn a bundle back into normalized rows (see normalize.py)
+def load(election, folder=FOLDER):
+    rows = []
+    for line, updated in _read(bundle_name(election, folder)).values():
+        rows.append({
+            "source": line[0],
+            "contest": line[1],
+            "candidate": line[2],
+            "party": line[3],
+            "votes": int(line[4]),
+            "percent": float(line[5]),
+            "reporting": float(line[6]) if line[6] else None,
+            "fetched_at": updated,
+        })
+    return rows
+
+
+#Write the chart CSVs for the California statewide and Clarity county contests (see clarity.py) from a bundle
+#(the Oregon scrapers build their chart CSVs themselves)
+def write_csvs(election, out_dir=".", folder=FOLDER):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    #Biggest first, like the APIs list them
+    rows = sorted(load(election, folder), key=lambda row: row["votes"], reverse=True)
+    pipeline.write_statewide_csvs([row for row in rows if row["source"] == "ca_sos"], out_dir)
+    for county in clarity.load_counties():
+        pipeline.write_shasta_csvs([row for row in rows if row["source"] == clarity.source_name(county)], out_dir, clarity.csv_namer(county))
+    print(f"Wrote the chart CSVs for {election} to {out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make the chart CSVs from an election's results bundle")
+    parser.add_argument("command", choices=["csvs"], help="Write the chart CSVs")
+    parser.add_argument("election", help="e.g. 2026-ca-primary")
+    parser.add_argument("--out", default=".", help="Where to write the CSVs")
+    args = parser.parse_args()
+    write_csvs(args.election, args.out)
+
+
+if __name__ == "__main__":
+    main()
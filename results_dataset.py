@@ -0,0 +1,65 @@
+# Writes every cycle's normalized results (see normalize.py) to one Parquet dataset, so after the election
+# all the results can be loaded at once instead of reading hundreds of CSVs and joining them by hand.
+# The dataset is split into a folder per source (results_dataset/source=ca_sos/, source=oregon/, ...) and each cycle
+# adds one new file to each folder, so nothing that was already written is ever read or rewritten.
+# Usage:
+#   results_dataset.write_cycle(cycle_rows)        # at the end of a scraper run
+#   df = results_dataset.load()                    # everything, as a pandas DataFrame
+#   df = results_dataset.load(source="oregon")     # just one source
+# Needs pyarrow (pip install pyarrow). If it isn't installed, the scrapers skip this step.
+# Licensed under a GNU General Public License v3.0
+
+import datetime, pandas as pd
+
+try:
+    import pyarrow as pa, pyarrow.dataset as ds, pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FOLDER = "results_dataset"
+
+#The columns in the dataset, in order. fetched_at is stored as a real timestamp (UTC) so it can be filtered and sorted quickly
+COLUMNS = ["source", "contest", "candidate", "party", "votes", "percent", "reporting", "fetched_at"]
+
+
+def _schema():
+    return pa.schema([
+        ("source", pa.string()),
+        ("contest", pa.string()),
+        ("candidate", pa.string()),
+        ("party", pa.string()),
+        ("votes", pa.int64()),
+        ("percent", pa.float64()),
+        ("reporting", pa.float64()),
+        ("fetched_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+#Add one cycle's rows to the dataset, and return how many rows were written
+def write_cycle(rows, folder=FOLDER):
+    if pa is None:
+        print("pyarrow isn't installed, so the Parquet dataset wasn't updated")
+        return 0
+    if not rows:
+        return 0
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df["fetched_at"] = pd.to_datetime(df["fetched_at"], utc=True)
+    table = pa.Table.from_pandas(df, schema=_schema(), preserve_index=False)
+    #One file per cycle in each source's folder, named after when the cycle ran so the files sort in order
+    cycle = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d_%H-%M-%S")
+    pq.write_to_dataset(table, folder, partition_cols=["source"], basename_template=f"cycle_{cycle}_{{i}}.parquet",
+                        existing_data_behavior="overwrite_or_ignore")
+    print(f"Added {len(rows)} rows to the {folder} dataset")
+    return len(rows)
+
+
+#Load the dataset as a pandas DataFrame. source and contest can be given to only read part of it
+def load(folder=FOLDER, source=None, contest=None):
+    dataset = ds.dataset(folder, format="parquet", partitioning="hive", schema=_schema())
+    condition = None
+    if source is not None:
+        condition = ds.field("source") == source
+    if contest is not None:
+        contest_condition = ds.field("contest") == contest
+        condition = contest_condition if condition is None else condition & contest_condition
+    return dataset.to_table(filter=condition, columns=COLUMNS).to_pandas()
@@ -0,0 +1,126 @@
+# Keeps every cycle's normalized results (see normalize.py) in a SQLite database, results.db, across elections,
+# so we can look at how any contest changed through the night, or compare it against an earlier election,
+# instead of only having the latest overwritten CSVs.
+# Each scraper saves its rows under its own election name:
+#   JPRscraper.py -> "2024-general", Mayscraper.py -> "2025-may-primary", calprimary.py -> "2026-ca-primary"
+# Usage:
+#   results_db.save_cycle(cycle_rows, "2026-ca-primary")                   # at the end of a scraper run
+#   results_db.history("2026-ca-primary", "Governor", "ca_sos")            # every count of a contest through the night
+#   results_db.compare("Governor", "2026-ca-primary", "2022-ca-primary")   # latest count of a contest in two elections
+#   results_db.final("2022-ca-primary")                                     # last count of every contest in an election
+# Contests are kept apart by source too (e.g. each Clarity county has its own "Member, County Central Committee").
+# Leave the source out to get the contest from every source that has it.
+# Licensed under a GNU General Public License v3.0
+
+import sqlite3, pandas as pd
+
+DB_FILE = "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    election TEXT NOT NULL,
+    source TEXT NOT NULL,
+    contest TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    party TEXT,
+    votes INTEGER,
+    percent REAL,
+    reporting REAL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (election, source, contest, candidate, fetched_at)
+);
+CREATE INDEX IF NOT EXISTS results_by_source_contest_time ON results (election, source, contest, fetched_at);
+"""
+
+#Insert a row, or update it if that candidate already has a count at that time (e.g. a run saved twice)
+UPSERT = """
+INSERT INTO results (election, source, contest, candidate, party, votes, percent, reporting, fetched_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (election, source, contest, candidate, fetched_at) DO UPDATE SET
+    party = excluded.party, votes = excluded.votes,
+    percent = excluded.percent, reporting = excluded.reporting
+"""
+
+
+#Databases made before source was part of the key are copied into the new table once
+#(if two sources had the same contest at the same time, only one of them was kept, so there's nothing to split up)
+def _migrate(db):
+    key = [row[1] for row in db.execute("PRAGMA table_info(results)") if row[5]]
+    if not key or "source" in key:
+        return
+    db.executescript(f"""
+        BEGIN;
+        ALTER TABLE results RENAME TO results_old;
+        DROP INDEX IF EXISTS results_by_contest_time;
+        {SCHEMA}
+        INSERT INTO results SELECT election, source, contest, candidate, party, votes, percent, reporting, fetched_at FROM results_old;
+        DROP TABLE results_old;
+        COMMIT;
+    """)
+    print("Added source to the results database's key")
+
+
+def connect(db_file=DB_FILE):
+    db = sqlite3.connect(db_file)
+    #WAL lets the live feed and the notebooks read while a scraper is writing
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    _migrate(db)
+    db.executescript(SCHEMA)
+    return db
+
+
+#Save one cycle's rows under an election name, all in one transaction, and return how many rows were saved
+def save_cycle(rows, election, db_file=DB_FILE):
+    if not rows:
+        return 0
+    db = connect(db_file)
+    try:
+        with db:
+            db.executemany(UPSERT, [(election, row["source"], row["contest"], row["candidate"], row["party"], row["votes"],
+                                     row["percent"], row["reporting"], row["fetched_at"]) for row in rows])
+    finally:
+        db.close()
+    print(f"Saved {len(rows)} rows for {election} to {db_file}")
+    return len(rows)
+
+
+def _query(sql, params, db_file):
+    db = connect(db_file)
+    try:
+        return pd.read_sql_query(sql, db, params=params)
+    finally:
+        db.close()
+
+
+#Every count of a contest in an election, oldest first. One row per candidate per cycle
+#source picks one source's contest. Without it, every source with a contest by that name is included
+def history(election, contest, source=None, db_file=DB_FILE):
+    return _query("""SELECT * FROM results WHERE election = ? AND contest = ? AND (? IS NULL OR source = ?)
+                     ORDER BY source, fetched_at, votes DESC""",
+                  (election, contest, source, source), db_file)
+
+
+#The latest count of every candidate in a contest (from each source that has it, if source isn't given)
+def latest(election, contest, source=None, db_file=DB_FILE):
+    return _query("""SELECT * FROM results AS r WHERE election = ? AND contest = ? AND (? IS NULL OR source = ?) AND fetched_at = (
+                         SELECT MAX(fetched_at) FROM results WHERE election = r.election AND source = r.source AND contest = r.contest)
+                     ORDER BY source, votes DESC""",
+                  (election, contest, source, source), db_file)
+
+
+#The last count of every contest in an election
+def final(election, db_file=DB_FILE):
+    return _query("""SELECT * FROM results AS r WHERE election = ? AND fetched_at = (
+                         SELECT MAX(fetched_at) FROM results WHERE election = r.election AND source = r.source AND contest = r.contest)
+                     ORDER BY source, contest, votes DESC""",
+                  (election,), db_file)
+
+
+#The latest count of a contest in two elections, side by side: Source, Candidate, Party, then votes and percent for each election
+def compare(contest, election, other_election, source=None, db_file=DB_FILE):
+    current = latest(election, contest, source, db_file)[["source", "candidate", "party", "votes", "percent"]]
+    current.columns = ["Source", "Candidate", "Party", f"Votes {election}", f"Percent {election}"]
+    previous = latest(other_election, contest, source, db_file)[["source", "candidate", "votes", "percent"]]
+    previous.columns = ["Source", "Candidate", f"Votes {other_election}", f"Percent {other_election}"]
+    return current.merge(previous, on=["Source", "Candidate"], how="outer")
@@ -0,0 +1,164 @@
+# Decides which raw snapshots in jsons/ to keep, instead of deleting everything that isn't from today.
+# For each source (california_cands, shasta_results, oregon_leg, ...):
+#   - every snapshot from the last hour is kept
+#   - from 1 to 6 hours old, one snapshot per 15 minutes is kept
+#   - from 6 to 24 hours old, one snapshot per hour is kept
+#   - older than that, snapshots are added to one compressed archive per source in jsons/archive/, and the file is deleted
+# Snapshots are tracked in jsons/manifest.json, in the order they were taken, so pruning only looks at the few
+# snapshots that just got old enough to move down a tier, and never has to list the whole folder.
+# Usage:
+#   retention.register("jsons/california_cands_2026-07-13_10-43.json")  # right after saving a snapshot
+#   retention.prune()                                                  # once at the end of the run
+# Licensed under a GNU General Public License v3.0
+
+import datetime, gzip, json, os, re, time, pytz
+
+FOLDER = "jsons"
+MANIFEST = os.path.join(FOLDER, "manifest.json")
+ARCHIVE_FOLDER = os.path.join(FOLDER, "archive")
+
+#(tier name, how old a snapshot gets before it leaves the tier, how far apart the snapshots it moves to the next tier are)
+#The last tier's snapshots go to the archive
+TIERS = [
+    ("recent", 3600, 15 * 60),
+    ("quarter_hourly", 6 * 3600, 3600),
+    ("hourly", 24 * 3600, None),
+]
+
+#Snapshot filenames end with the date and time they were taken
+FILENAME_PATTERN = re.compile(r"^(.+)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.json$")
+
+
+#Which source a snapshot is from, from its filename ("jsons/oregon_leg_2024-11-05_20-03.json" -> "oregon_leg")
+def source_of(filename):
+    match = FILENAME_PATTERN.match(os.path.basename(filename))
+    if match:
+        return match.group(1)
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def load_manifest():
+    if os.path.isfile(MANIFEST):
+        with open(MANIFEST) as f:
+            return json.load(f)
+    return _adopt_existing()
+
+
+def save_manifest(manifest):
+    if not os.path.exists(FOLDER):
+        os.makedirs(FOLDER)
+    with open(MANIFEST + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(MANIFEST + ".tmp", MANIFEST)
+
+
+#The first time the manifest is used, start it off with the snapshots that are already in the folder
+#This is the only time the folder is listed
+def _adopt_existing():
+    manifest = {"sources": {}}
+    if not os.path.isdir(FOLDER):
+        return manifest
+    snapshots = []
+    for filename in os.listdir(FOLDER):
+        path = os.path.join(FOLDER, filename)
+        if not filename.endswith(".json") or path == MANIFEST:
+            continue
+        match = FILENAME_PATTERN.match(filename)
+        #Use the date in the filename (Pacific time) if there is one, otherwise when the file was last changed
+        if match:
+            taken = pytz.timezone('US/Pacific').localize(datetime.datetime.strptime(match.group(2), "%Y-%m-%d_%H-%M")).timestamp()
+        else:
+            taken = os.path.getmtime(path)
+        snapshots.append((taken, path))
+    for taken, path in sorted(snapshots):
+        _add(manifest, path, taken)
+    return manifest
+
+
+def _add(manifest, filename, taken):
+    tiers = manifest["sources"].setdefault(source_of(filename), {name: [] for name, age, spacing in TIERS})
+    recent = tiers[TIERS[0][0]]
+    #The scrapers save some files more than once in a run, only track them once
+    if recent and recent[-1][1] == filename:
+        return
+    recent.append([taken, filename])
+
+
+#Add a snapshot to the manifest. taken is when it was taken (defaults to now)
+def register(filename, taken=None, manifest=None):
+    save = manifest is None
+    if manifest is None:
+        manifest = load_manifest()
+    _add(manifest, filename, time.time() if taken is None else taken)
+    if save:
+        save_manifest(manifest)
+
+
+#Add a snapshot to the source's compressed archive. Each snapshot is one JSON line, and each run adds a new gzip member,
+#so nothing already in the archive has to be read or rewritten
+def _archive(source, taken, filename):
+    if not os.path.exists(ARCHIVE_FOLDER):
+        os.makedirs(ARCHIVE_FOLDER)
+    with open(filename) as f:
+        data = json.load(f)
+    with gzip.open(os.path.join(ARCHIVE_FOLDER, f"{source}.jsonl.gz"), "at") as archive:
+        archive.write(json.dumps({"taken": taken, "file": os.path.basename(filename), "data": data}) + "\n")
+
+
+def _delete(filename):
+    if os.path.isfile(filename):
+        os.remove(filename)
+        print(f"Deleted old file: {filename}")
+
+
+#Move snapshots down the tiers. Only the oldest snapshots in each tier are looked at, and only until one is young enough to stay
+def prune(now=None, manifest=None):
+    save = manifest is None
+    if manifest is None:
+        manifest = load_manifest()
+    now = time.time() if now is None else now
+    for source, tiers in manifest["sources"].items():
+        for level, (name, max_age, spacing) in enumerate(TIERS):
+            tier = tiers[name]
+            while tier and now - tier[0][0] > max_age:
+                taken, filename = tier.pop(0)
+                if not os.path.isfile(filename):
+                    continue
+                if spacing is None:
+                    _archive(source, taken, filename)
+                    _delete(filename)
+                    continue
+                #Keep one snapshot per spacing: the first one in each 15 minute (or hour) block
+                next_tier = tiers[TIERS[level + 1][0]]
+                if next_tier and int(next_tier[-1][0] // spacing) == int(taken // spacing):
+                    _delete(filename)
+                else:
+                    next_tier.append([taken, filename])
+    if save:
+        save_manifest(manifest)
+
+
+#Every source we have snapshots for, in the manifest or the archive
+def sources(manifest=None):
+    manifest = manifest or load_manifest()
+    found = set(manifest["sources"])
+    if os.path.isdir(ARCHIVE_FOLDER):
+        found.update(name[:-len(".jsonl.gz")] for name in os.listdir(ARCHIVE_FOLDER) if name.endswith(".jsonl.gz"))
+    return sorted(found)
+
+
+#Every snapshot we still have for a source, oldest first, as (taken, data). Reads the archive first, then the files
+def iter_snapshots(source, manifest=None):
+    archive_path = os.path.join(ARCHIVE_FOLDER, f"{source}.jsonl.gz")
+    if os.path.isfile(archive_path):
+        with gzip.open(archive_path, "rt") as archive:
+            for line in archive:
+                entry = json.loads(line)
+                yield entry["taken"], entry["data"]
+    manifest = manifest or load_manifest()
+    tiers = manifest["sources"].get(source, {})
+    for name, max_age, spacing in reversed(TIERS):
+        for taken, filename in tiers.get(name, []):
+            if os.path.isfile(filename):
+                with open(filename) as f:
+                    yield taken, json.load(f)
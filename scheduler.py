@@ -0,0 +1,88 @@
+# Keeps a scraper run inside its time limit. The GitHub workflow kills the job after 5 minutes, so instead of
+# doing everything in file order and hoping, the run gets a deadline, the charts are published in priority order,
+# and anything low priority that won't fit before the deadline is skipped (and listed at the end of the run).
+# Charts marked "required" (the Governor and Senate charts) are always published, even past the deadline.
+# Priorities are set in calraces.json and shastaraces.json:
+#   {"filename": "California_Governor_results.csv", "Key": "Z6Zyr", "priority": 1, "required": true}
+# A lower number goes first. Charts without a priority go last.
+# Usage:
+#   cycle = scheduler.CycleScheduler()            # deadline from the CYCLE_DEADLINE environment variable
+#   pipeline.publish_charts(dw, races, latest_time, scheduler=cycle)
+#   if cycle.has_time("county breakdown", 60):    # only start optional work that should finish in time
+#       ...
+#   cycle.report()
+# Licensed under a GNU General Public License v3.0
+
+import os, time
+
+#Seconds from the start of the script to the deadline. The workflow's timeout is 5 minutes,
+#and installing everything takes about a minute of that, so this leaves some room to commit the results
+#NOTE: Change this if the workflow's timeout-minutes changes
+DEFAULT_DEADLINE = 180
+
+#Priority for charts that don't have one
+DEFAULT_PRIORITY = 100
+
+#How long one chart takes to publish (three Datawrapper calls) until we've timed a few
+DEFAULT_CHART_SECONDS = 3.0
+
+#The longest a single request can take
+MAX_REQUEST_TIMEOUT = 30
+
+
+class CycleScheduler:
+    def __init__(self, deadline=None):
+        if deadline is None:
+            deadline = float(os.environ.get("CYCLE_DEADLINE", DEFAULT_DEADLINE))
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline
+        self.chart_times = []
+        self.skipped = []
+        self.published = []
+
+    #Seconds left before the deadline (negative once it's passed)
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    #A timeout for a request, so a stalled request can't run past the deadline
+    def timeout(self):
+        return max(1, min(MAX_REQUEST_TIMEOUT, self.remaining()))
+
+    #Whether there's time to start something that should take about estimate seconds. If not, it's listed as skipped
+    def has_time(self, name, estimate):
+        if self.remaining() >= estimate:
+            return True
+        self.skipped.append(name)
+        print(f"Skipping {name}: {self.remaining():.1f} seconds left, it needs about {estimate:.1f}")
+        return False
+
+    #How long a chart takes to publish, from the ones published so far
+    def chart_estimate(self):
+        if not self.chart_times:
+            return DEFAULT_CHART_SECONDS
+        return sum(self.chart_times) / len(self.chart_times)
+
+    #Races in the order they should be published: required first, then by priority, then in file order
+    def ordered(self, races):
+        return sorted(races, key=lambda race: (not race.get("required", False), race.get("priority", DEFAULT_PRIORITY)))
+
+    #Whether to publish a chart now. Required charts are always published
+    def should_publish(self, race):
+        if race.get("required", False):
+            return True
+        return self.has_time(f"chart {race.get('filename')}", self.chart_estimate())
+
+    def chart_published(self, race, seconds):
+        self.chart_times.append(seconds)
+        self.published.append(race.get("filename"))
+
+    #Print what was published and what was skipped, and return the skipped list
+    def report(self):
+        took = time.monotonic() - self.started
+        print(f"Run took {took:.0f} seconds ({self.remaining():.0f} seconds before the deadline), "
+              f"published {len(self.published)} charts")
+        if self.skipped:
+            print(f"Skipped {len(self.skipped)} things to make the deadline:")
+            for name in self.skipped:
+                print(f"  {name}")
+        return self.skipped
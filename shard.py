@@ -0,0 +1,175 @@
+# Splits a scraper run across several workers, so publishing lots of charts isn't stuck in one process.
+# Every contest belongs to exactly one shard, picked from a hash of its source and name, so the split is the same on every
+# machine, and a contest stays on its shard when other contests are added or dropped (so its last_cycle and holds files
+# still have it). Each worker runs the scraper with --shard i/N and only writes and publishes its own contests.
+# Fetching isn't split: each source is one request, so every worker makes it.
+# Every shard checks its own contests against its own last states with its own validation gate.
+# Shard 0 is the lead: it also saves the snapshots, and does the county breakdowns and cleans up old snapshots.
+# The steps that need every contest (projections, the Parquet dataset, the results database, the bundle) are done by the
+# merge, with the rows each shard put in its report, so they only get rows their own shard let through (see cycle_outputs.py).
+# Usage:
+#   python shard.py run 4               # run calprimary.py as 4 local processes, then merge
+#   python calprimary.py --shard 2/4    # run one shard, e.g. on its own machine
+#   python shard.py merge 4             # combine the shards' reports and save their rows once they've all finished
+# Each shard writes its run report to shards/ and keeps its own last_cycle file, so the shards never write the same file.
+# Licensed under a GNU General Public License v3.0
+
+import argparse, json, os, subprocess, sys, time, zlib
+
+import freshness
+
+FOLDER = "shards"
+
+
+#Which shard each (source, contest) key belongs to, as {key: shard}
+def assign(keys, count):
+    return {(source, contest): zlib.crc32(f"{source}\x00{contest}".encode("utf-8")) % count for source, contest in keys}
+
+
+#Read --shard i/N from the command line (and take it out, so the scraper doesn't see it). Returns (i, N), or None
+def from_argv():
+    if "--shard" not in sys.argv:
+        return None
+    position = sys.argv.index("--shard")
+    value = sys.argv[position + 1]
+    del sys.argv[position:position + 2]
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"--shard {value}: the shard has to be from 0 to {count - 1}")
+    print(f"Running shard {index} of {count}")
+    return index, count
+
+
+#Whether this run is the lead (shard 0), or not sharded at all
+def is_lead(shard):
+    return shard is None or shard[0] == 0
+
+
+#Only the rows for contests in this shard
+def filter_rows(rows, shard):
+    if shard is None:
+        return rows
+    index, count = shard
+    shards = assign({(row["source"], row["contest"]) for row in rows}, count)
+    return [row for row in rows if shards[(row["source"], row["contest"])] == index]
+
+
+def _name(shard):
+    return f"{shard[0]}_of_{shard[1]}"
+
+
+#Where this shard keeps what each contest looked like last run (see diff.py)
+def state_file(shard, default):
+    if shard is None:
+        return default
+    root, ext = os.path.splitext(default)
+    return f"{root}_shard_{_name(shard)}{ext}"
+
+
+#Where this shard logs its freshness times until the merge adds them to the main log (see freshness.py)
+def freshness_log(shard):
+    if not os.path.exists(FOLDER):
+        os.makedirs(FOLDER)
+    return os.path.join(FOLDER, f"freshness_{_name(shard)}.csv")
+
+
+#Save this shard's run report: how many contests it had, what it published and skipped, and how long it took
+#rows are the shard's rows that passed its gate, and changed is the (source, contest) keys that changed since its last run,
+#for the merge to save (see cycle_outputs.py)
+def save_report(shard, rows, changed, election, cycle):
+    if not os.path.exists(FOLDER):
+        os.makedirs(FOLDER)
+    report = {
+        "shard": shard[0],
+        "count": shard[1],
+        "contests": len({(row["source"], row["contest"]) for row in rows}),
+        "published": cycle.published,
+        "skipped": cycle.skipped,
+        "seconds": round(time.monotonic() - cycle.started, 2),
+        "finished": time.time(),
+        "election": election,
+        "rows": rows,
+        "changed": sorted(changed),
+    }
+    with open(os.path.join(FOLDER, f"report_{_name(shard)}.json"), "w") as f:
+        json.dump(report, f, indent=1)
+
+
+#Combine the shards' reports and freshness logs. Returns the combined report
+def merge(count):
+    reports = []
+    for index in range(count):
+        path = os.path.join(FOLDER, f"report_{_name((index, count))}.json")
+        if not os.path.isfile(path):
+            print(f"Shard {index} of {count} has no report, it may have failed")
+            continue
+        with open(path) as f:
+            reports.append(json.load(f))
+        #A report is only merged once, so a shard that fails next time doesn't have its old rows saved again
+        os.remove(path)
+
+    #Move the shards' freshness times into the main log, then rebuild the histograms once
+    added = False
+    for index in range(count):
+        path = freshness_log((index, count))
+        if os.path.isfile(path):
+            with open(path) as f:
+                lines = f.readlines()
+            freshness.upgrade_log()
+            new_log = not os.path.isfile(freshness.LOG_FILE)
+            with open(freshness.LOG_FILE, "a") as log:
+                log.writelines(lines if new_log else lines[1:])
+            os.remove(path)
+            added = True
+    if added:
+        freshness.save_histograms()
+
+    #Save every shard's rows together, for the steps that need every contest (the bundle, the database and so on)
+    rows = [row for report in reports for row in report.get("rows", [])]
+    if rows:
+        import baseline, cycle_outputs
+        changed = {tuple(key) for report in reports for key in report.get("changed", [])}
+        cycle_outputs.save(rows, changed, reports[0]["election"], baseline.load())
+
+    combined = {
+        "count": count,
+        "shards_reported": len(reports),
+        "contests": sum(report["contests"] for report in reports),
+        "published": [chart for report in reports for chart in report["published"]],
+        "skipped": [name for report in reports for name in report["skipped"]],
+        "slowest_shard_seconds": max((report["seconds"] for report in reports), default=0),
+        "shard_seconds": {report["shard"]: report["seconds"] for report in reports},
+    }
+    with open(os.path.join(FOLDER, "report.json"), "w") as f:
+        json.dump(combined, f, indent=1)
+    print(f"{combined['shards_reported']} of {count} shards reported: {combined['contests']} contests, "
+          f"{len(combined['published'])} charts published, {len(combined['skipped'])} skipped, "
+          f"slowest shard took {combined['slowest_shard_seconds']} seconds")
+    return combined
+
+
+#Run every shard of a scraper as its own process, wait for them all, then merge
+def run(count, script="calprimary.py"):
+    started = time.monotonic()
+    workers = [subprocess.Popen([sys.executable, script, "--shard", f"{index}/{count}"]) for index in range(count)]
+    failed = [index for index, worker in enumerate(workers) if worker.wait() != 0]
+    for index in failed:
+        print(f"Shard {index} of {count} failed")
+    print(f"All shards finished in {time.monotonic() - started:.1f} seconds")
+    merge(count)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a scraper split across several workers")
+    parser.add_argument("command", choices=["run", "merge"], help="run every shard locally, or merge the shards' reports")
+    parser.add_argument("count", type=int, help="How many shards")
+    parser.add_argument("--script", default="calprimary.py", help="The scraper to run")
+    args = parser.parse_args()
+    if args.command == "run":
+        sys.exit(0 if run(args.count, args.script) else 1)
+    merge(args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Builds a plain HTML results page for every contest, with an SVG bar chart, plus an index page, straight from the
+# normalized rows (see normalize.py). It's a fallback for when Datawrapper is slow or rate-limiting us: the pages
+# don't need any API calls, and results_site/ can be copied to any static host as it is.
+# Only the pages for contests that changed since the last build are rewritten. Each page's fingerprint is kept in
+# results_site/manifest.json, and the index is only rewritten if a page was.
+# Usage: static_site.build(cycle_rows)
+# Licensed under a GNU General Public License v3.0
+
+import html, json, os, re
+
+import diff, normalize
+
+FOLDER = "results_site"
+MANIFEST = "manifest.json"
+
+#What each source is called on the pages
+SOURCE_NAMES = {
+    "ca_sos": "California",
+    "oregon": "Oregon",
+}
+
+#Bar colors by party, anything else is gray
+PARTY_COLORS = {
+    "Democratic": "#2f6db5", "Democrat": "#2f6db5",
+    "Republican": "#c23b3b",
+}
+OTHER_COLOR = "#8a8a8a"
+
+BAR_HEIGHT = 26
+CHART_WIDTH = 640
+LABEL_WIDTH = 220
+
+STYLE = """
+body { font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif; max-width: 720px; margin: 2em auto; padding: 0 1em; color: #222; }
+h1 { font-size: 1.5em; margin-bottom: 0.2em; }
+.meta { color: #666; font-size: 0.9em; }
+table { border-collapse: collapse; width: 100%; margin-top: 1em; }
+th, td { text-align: left; padding: 0.3em 0.5em; border-bottom: 1px solid #ddd; }
+td.num, th.num { text-align: right; }
+a { color: #2f6db5; }
+"""
+
+
+def source_name(source):
+    if source.startswith("clarity_"):
+        return source[len("clarity_"):].replace("_", " ").title() + " County"
+    return SOURCE_NAMES.get(source, source)
+
+
+#The page's filename, e.g. ("ca_sos", "Governor") -> "ca_sos-governor.html"
+def page_name(source, contest):
+    return f"{source}-{re.sub(r'[^a-z0-9]+', '-', contest.lower()).strip('-')}.html"
+
+
+def _page(title, body):
+    return (f'<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+            f'<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+            f'<title>{html.escape(title)}</title>\n<style>{STYLE}</style>\n</head>\n<body>\n{body}\n</body>\n</html>\n')
+
+
+#A horizontal bar for each candidate, longest bar = most votes
+def bar_chart(contest_rows):
+    most = max([row["votes"] for row in contest_rows] + [1])
+    bar_space = CHART_WIDTH - LABEL_WIDTH - 90
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="100%" viewBox="0 0 {CHART_WIDTH} {BAR_HEIGHT * len(contest_rows)}" '
+             f'role="img" aria-label="Results chart">']
+    for i, row in enumerate(contest_rows):
+        y = i * BAR_HEIGHT
+        width = row["votes"] / most * bar_space
+        color = PARTY_COLORS.get(row["party"], OTHER_COLOR)
+        parts.append(f'<text x="{LABEL_WIDTH - 8}" y="{y + 18}" text-anchor="end" font-size="13">{html.escape(row["candidate"])}</text>')
+        parts.append(f'<rect x="{LABEL_WIDTH}" y="{y + 4}" width="{width:.1f}" height="{BAR_HEIGHT - 8}" fill="{color}"></rect>')
+        parts.append(f'<text x="{LABEL_WIDTH + width + 6:.1f}" y="{y + 18}" font-size="13">{row["percent"]:.1f}%</text>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def contest_page(source, contest, contest_rows):
+    ranked = sorted(contest_rows, key=lambda row: row["votes"], reverse=True)
+    reporting = ranked[0]["reporting"]
+    meta = f"{html.escape(source_name(source))} &middot; updated {html.escape(ranked[0]['fetched_at'])}"
+    if reporting is not None:
+        meta += f" &middot; {reporting:.1f}% of precincts reporting"
+    table = ['<table>\n<tr><th>Candidate</th><th>Party</th><th class="num">Votes</th><th class="num">Percent</th></tr>']
+    for row in ranked:
+        table.append(f'<tr><td>{html.escape(row["candidate"])}</td><td>{html.escape(row["party"])}</td>'
+                     f'<td class="num">{row["votes"]:,}</td><td class="num">{row["percent"]:.1f}%</td></tr>')
+    table.append("</table>")
+    body = (f'<p><a href="index.html">All results</a></p>\n<h1>{html.escape(contest)}</h1>\n<p class="meta">{meta}</p>\n'
+            f'{bar_chart(ranked)}\n' + "\n".join(table))
+    return _page(contest, body)
+
+
+def index_page(entries):
+    body = ["<h1>Election results</h1>"]
+    for source in sorted({entry["source"] for entry in entries}):
+        body.append(f"<h2>{html.escape(source_name(source))}</h2>\n<table>\n"
+                    '<tr><th>Contest</th><th>Leading</th><th class="num">Percent</th></tr>')
+        for entry in sorted((entry for entry in entries if entry["source"] == source), key=lambda entry: entry["contest"]):
+            body.append(f'<tr><td><a href="{html.escape(entry["page"])}">{html.escape(entry["contest"])}</a></td>'
+                        f'<td>{html.escape(entry["leader"] or "")}</td><td class="num">{entry["percent"]:.1f}%</td></tr>')
+        body.append("</table>")
+    return _page("Election results", "\n".join(body))
+
+
+def _write(path, text):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+#Rebuild the pages for contests that changed, and the index if any did. Returns the pages that were written
+def build(rows, folder=FOLDER):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    manifest_path = os.path.join(folder, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    written = []
+    for (source, contest), contest_rows in normalize.by_contest(rows).items():
+        page = page_name(source, contest)
+        new_fingerprint = diff.fingerprint(contest_rows)
+        entry = manifest.get(page)
+        if entry is not None and entry["fingerprint"] == new_fingerprint and os.path.isfile(os.path.join(folder, page)):
+            continue
+        _write(os.path.join(folder, page), contest_page(source, contest, contest_rows))
+        leader = max(contest_rows, key=lambda row: row["votes"])
+        manifest[page] = {"source": source, "contest": contest, "fingerprint": new_fingerprint, "page": page,
+                          "leader": leader["candidate"] if leader["votes"] > 0 else None, "percent": leader["percent"]}
+        written.append(page)
+
+    if written or not os.path.isfile(os.path.join(folder, "index.html")):
+        _write(os.path.join(folder, "index.html"), index_page(list(manifest.values())))
+        _write(manifest_path, json.dumps(manifest, indent=1))
+    print(f"Rebuilt {len(written)} of {len(manifest)} results pages in {folder}")
+    return written
@@ -0,0 +1,124 @@
+# Runs the fetch -> normalize/write -> publish steps for several sources at the same time, connected by queues,
+# instead of one source after another. While one source's charts are being published, the next source is already being
+# fetched, so a run takes about as long as the slower of fetching and publishing, not the two added up.
+#   fetch:   one thread per source, puts each response on a queue as soon as it comes in
+#   process: saves the snapshot, normalizes, writes the CSVs and works out what changed (see diff.py),
+#            then queues each changed contest's chart
+#   publish: publishes the queued charts, the most important first (see scheduler.py)
+# The queues are small, so if publishing falls behind, processing waits for it instead of piling up work.
+# Each source is a dict:
+#   {"name": "statewide",                                   # for the printouts
+#    "fetch": lambda: pipeline.fetch_statewide(),           # returns the raw response
+#    "save": lambda data: pipeline.save_snapshot(...),      # optional, saves the raw response
+#    "rows": lambda data: normalize.cal_sos_rows(...),      # returns the normalized rows
+#    "write": pipeline.write_statewide_csvs,                # writes the CSVs from the rows
+#    "csv_name": pipeline.statewide_csv_name,               # the CSV file for a contest
+#    "races": calraces,                                     # the charts, from calraces.json
+#    "check": lambda data: validate.clarity_problems(...),  # optional, finds problems in the raw response (see validate.py)
+#    "updated": normalize.cal_updated_times}                # optional, when the source says each contest changed (see freshness.py)
+# Licensed under a GNU General Public License v3.0
+
+import itertools, queue, threading, time
+
+import diff, pipeline, scheduler
+
+#How many responses, and how many charts, can wait in the queues
+QUEUE_SIZE = 8
+
+#Marks the end of a queue
+_DONE = None
+
+
+#Run every source through the pipeline. Returns a dict with:
+#  rows:    the normalized rows from every source that this run wrote (select's, if given) and the gate let through
+#  states:  the new contest states to save for the next run (see diff.py), minus any charts that were skipped
+#  events:  the change events
+#  errors:  (source name, exception) for any source that failed
+#  held:    {(source, contest): [reasons]} for the contests the gate held back
+#select picks the rows this run checks, writes and publishes (e.g. one shard's, see shard.py), the default is all of them
+#out_dir is where the sources write their CSVs, so the charts are published from there
+#gate checks the rows first (see validate.py). The contests it holds back aren't written, published or saved, and aren't in rows
+def run_cycle(sources, dw, previous, latest_time, cycle=None, tracker=None, select=None, out_dir=".", gate=None, queue_size=QUEUE_SIZE):
+    fetched = queue.Queue(maxsize=queue_size)
+    to_publish = queue.PriorityQueue(maxsize=queue_size)
+    order = itertools.count()
+    result = {"rows": [], "states": {}, "events": [], "errors": [], "held": {}}
+    #The charts queued, the charts published, and the new contest states for each source, to work out which states to save
+    queued = {source["name"]: [] for source in sources}
+    published = []
+    current = {source["name"]: {} for source in sources}
+
+    def fetch(source):
+        try:
+            data = source["fetch"]()
+            fetched.put((source, data, time.time()))
+        except Exception as err:
+            print(f"Fetching {source['name']} failed: {err}")
+            result["errors"].append((source["name"], err))
+        finally:
+            fetched.put((source, _DONE, None))
+
+    def process():
+        remaining = len(sources)
+        while remaining:
+            source, data, seen_at = fetched.get()
+            if data is _DONE:
+                remaining -= 1
+                continue
+            try:
+                if source.get("save") is not None:
+                    source["save"](data)
+                rows = source["rows"](data)
+                #The other rows belong to another run (e.g. another shard), which checks them against its own last states
+                rows = select(rows) if select is not None else rows
+                if gate is not None:
+                    problems = source["check"](data) if source.get("check") is not None else None
+                    rows, held = gate.check(previous, rows, problems)
+                    result["held"].update(held)
+                result["rows"] += rows
+                parsed_at = time.time()
+                source["write"](rows)
+                written_at = time.time()
+                events, changed, source_current = diff.compare(previous, rows)
+                print(f"{source['name']}: {len(changed)} contests changed, {len(events)} changes")
+                result["events"] += events
+                current[source["name"]] = source_current
+                if tracker is not None:
+                    if source.get("updated") is not None:
+                        tracker.mark_upstream(changed, source["updated"](data))
+                    tracker.mark(changed, "seen", seen_at)
+                    tracker.mark(changed, "parsed", parsed_at)
+                    tracker.mark(changed, "written", written_at)
+                races = pipeline.changed_races(source["races"], changed, source["csv_name"])
+                queued[source["name"]] += races
+                #The most important charts are published first, like scheduler.ordered()
+                for race in races:
+                    to_publish.put(((not race.get("required", False), race.get("priority", scheduler.DEFAULT_PRIORITY), next(order)), race))
+            except Exception as err:
+                print(f"Processing {source['name']} failed: {err}")
+                result["errors"].append((source["name"], err))
+        to_publish.put(((True, float("inf"), next(order)), _DONE))
+
+    def publish():
+        while True:
+            priority, race = to_publish.get()
+            if race is _DONE:
+                return
+            try:
+                published.extend(pipeline.publish_charts(dw, [race], latest_time, out_dir, scheduler=cycle, tracker=tracker))
+            except Exception as err:
+                print(f"Publishing {race.get('filename')} failed: {err}")
+                result["errors"].append((race.get("filename"), err))
+
+    threads = [threading.Thread(target=fetch, args=(source,)) for source in sources]
+    threads += [threading.Thread(target=process), threading.Thread(target=publish)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    #Save the states for everything that changed, except contests whose chart wasn't published
+    for source in sources:
+        name = source["name"]
+        result["states"].update(pipeline.published_states(current[name], queued[name], published, source["csv_name"]))
+    return result
@@ -0,0 +1,125 @@
+# Checks each cycle's results before they're published, so bad upstream data doesn't go out on a chart
+# (and cost more API calls to fix afterwards). Every contest in the cycle is checked at once, on whole columns:
+#   lengths     - a Clarity contest whose candidate names (CH), votes (V) and percents (PCT) aren't the same length.
+#                 normalize.clarity_rows pairs them up with zip, which would quietly drop the extras
+#   votes_down  - a candidate has fewer votes than in the last published cycle
+#   share_sum   - the candidates' percents don't add up to about 100 (allowing for each percent being rounded)
+#   candidates  - a candidate from the last published cycle is missing
+# Contests that fail are held back: they aren't written, published or saved as the last cycle, so the next cycle checks
+# them again against the last good results. The other contests publish as usual.
+# Counties do sometimes really lower a count or drop a candidate, so if the same held-back results (the same fingerprint,
+# see diff.py) come back CONFIRM_CYCLES cycles in a row, they're let through. Results with mismatched lengths never are.
+# Usage:
+#   gate = validate.Gate()                               # loads the held-back contests from HOLDS_FILE
+#   rows, held = gate.check(previous, rows, problems)    # problems from validate.clarity_problems(data, source)
+#   gate.save()
+# Licensed under a GNU General Public License v3.0
+
+import json, os, numpy as np, pandas as pd
+
+import diff, normalize
+
+HOLDS_FILE = "validation_holds.json"
+
+#How far from 100 the percents can add up to, plus ROUNDING for each candidate (the sources round to one decimal place)
+SHARE_TOLERANCE = 0.5
+ROUNDING = 0.05
+
+#How many cycles in a row the same held-back results have to come back before they're let through
+CONFIRM_CYCLES = 3
+
+
+#Clarity contests whose CH, V and PCT lists aren't the same length, as {(source, contest): [reason]}
+def clarity_problems(contests, source):
+    problems = {}
+    for contest in contests:
+        lengths = [len(contest.get(field) or []) for field in ("CH", "V", "PCT")]
+        if len(set(lengths)) > 1:
+            problems[(source, contest["C"])] = [f"lengths: CH/V/PCT have {lengths[0]}/{lengths[1]}/{lengths[2]} entries"]
+    return problems
+
+
+#Check every contest in rows against the last published states (see diff.py), and return {(source, contest): [reasons]}
+#for the ones that fail
+def check_rows(previous, rows):
+    df = pd.DataFrame(rows, columns=["source", "contest", "candidate", "votes", "percent"])
+    if df.empty:
+        return {}
+    codes, keys = pd.factorize(pd.MultiIndex.from_arrays([df["source"], df["contest"]]))
+    count = len(keys)
+    candidates = np.bincount(codes, minlength=count)
+    votes = df["votes"].to_numpy(dtype=float)
+    share = np.bincount(codes, weights=df["percent"].to_numpy(dtype=float), minlength=count)
+    total = np.bincount(codes, weights=votes, minlength=count)
+    share_sum = (total > 0) & (np.abs(share - 100) > SHARE_TOLERANCE + ROUNDING * candidates)
+
+    #Last cycle's votes for every candidate in these contests, lined up with this cycle's rows
+    before = [(position, candidate, old_votes) for position, key in enumerate(keys) if key in previous
+              for candidate, old_votes in previous[key]["votes"].items()]
+    before = pd.DataFrame(before, columns=["code", "candidate", "old_votes"])
+    lined_up = pd.DataFrame({"code": codes, "candidate": df["candidate"], "votes": votes}).merge(
+        before, on=["code", "candidate"], how="outer", indicator=True)
+    #New candidates have no old votes, and missing ones have no votes now (they're counted below). Those are NaN and compare as False
+    with np.errstate(invalid="ignore"):
+        down = lined_up["old_votes"].to_numpy() > lined_up["votes"].to_numpy()
+    votes_down = np.bincount(lined_up["code"].to_numpy(dtype=int), weights=down, minlength=count) > 0
+    missing = (lined_up["_merge"] == "right_only").to_numpy()
+    missing_candidates = np.bincount(lined_up["code"].to_numpy(dtype=int), weights=missing, minlength=count).astype(int)
+
+    failed = {}
+    for position in np.flatnonzero(share_sum | votes_down | (missing_candidates > 0)).tolist():
+        reasons = []
+        if votes_down[position]:
+            reasons.append("votes_down: a candidate has fewer votes than last cycle")
+        if share_sum[position]:
+            reasons.append(f"share_sum: the percents add up to {share[position]:.1f}")
+        if missing_candidates[position]:
+            reasons.append(f"candidates: {missing_candidates[position]} candidate(s) from last cycle are missing")
+        failed[tuple(keys[position])] = reasons
+    return failed
+
+
+class Gate:
+    def __init__(self, filename=HOLDS_FILE):
+        self.filename = filename
+        #{(source, contest): {"fingerprint": ..., "cycles": how many cycles in a row it's been held with that fingerprint}}
+        self.holds = {}
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                self.holds = {(entry["source"], entry["contest"]): entry["hold"] for entry in json.load(f)}
+
+    #Split the rows into the ones that can be published and the contests that are held back.
+    #problems are any problems found in the raw response, like clarity_problems(). Returns (rows, {(source, contest): [reasons]})
+    def check(self, previous, rows, problems=None):
+        failed = check_rows(previous, rows)
+        for key, reasons in (problems or {}).items():
+            failed[key] = reasons + failed.get(key, [])
+        if not failed:
+            for key in {(row["source"], row["contest"]) for row in rows}:
+                self.holds.pop(key, None)
+            return rows, {}
+
+        contests = normalize.by_contest(rows)
+        held = {}
+        for key in contests:
+            if key not in failed:
+                self.holds.pop(key, None)
+                continue
+            new_fingerprint = diff.fingerprint(contests[key])
+            hold = self.holds.get(key)
+            cycles = hold["cycles"] + 1 if hold is not None and hold["fingerprint"] == new_fingerprint else 1
+            #The same results keep coming back, so they're probably a real correction
+            if cycles >= CONFIRM_CYCLES and not any(reason.startswith("lengths") for reason in failed[key]):
+                print(f"Letting {key[1]} through after {cycles} cycles of the same results: {'; '.join(failed[key])}")
+                self.holds.pop(key, None)
+                continue
+            self.holds[key] = {"fingerprint": new_fingerprint, "cycles": cycles}
+            held[key] = failed[key]
+            print(f"Holding back {key[1]} ({key[0]}): {'; '.join(failed[key])}")
+        return [row for row in rows if (row["source"], row["contest"]) not in held], held
+
+    def save(self):
+        saved = [{"source": source, "contest": contest, "hold": hold} for (source, contest), hold in self.holds.items()]
+        with open(self.filename + ".tmp", "w") as f:
+            json.dump(saved, f)
+        os.replace(self.filename + ".tmp", self.filename)